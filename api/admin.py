@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Hunt, Puzzle, PuzzleImage, Team, Hint, Announcement, PuzzleTimeMaintenance, HuntImage, Rule
+from .models import User, Hunt, Puzzle, PuzzleImage, Team, Hint, Announcement, PuzzleTimeMaintenance, HuntImage, Rule, LeaderboardEntry, TeamMembership, TeamEvent
 
 # Register your models here.
 
@@ -13,4 +13,6 @@ admin.site.register(Announcement)
 admin.site.register(PuzzleTimeMaintenance)
 admin.site.register(HuntImage)
 admin.site.register(Rule)
-
+admin.site.register(LeaderboardEntry)
+admin.site.register(TeamMembership)
+admin.site.register(TeamEvent)
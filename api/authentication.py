@@ -0,0 +1,67 @@
+# jwt authentication without loading the user row on every request. the
+# access token already carries the id, names, email and staff flag, so
+# request.user is built from those claims. the only per user state checked
+# is whether the account still exists and is active, and that answer is
+# cached for a short while (dropped right away when the user is saved).
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+
+from .models import User
+
+
+class ClaimsUser(TokenUser):
+    # request.user for jwt requests. not a model instance, use .id for
+    # foreign keys and m2m adds
+
+    @cached_property
+    def email(self):
+        return self.token.get('email')
+
+    @cached_property
+    def first_name(self):
+        return self.token.get('first_name')
+
+    @cached_property
+    def last_name(self):
+        return self.token.get('last_name')
+
+    @cached_property
+    def phone(self):
+        return self.token.get('phone')
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}"
+
+
+def user_state_cache_key(user_id):
+    return f"user:{user_id}:is_active"
+
+
+def is_user_active(user_id):
+    key = user_state_cache_key(user_id)
+    is_active = cache.get(key)
+    if is_active is None:
+        # a deleted user counts as inactive
+        is_active = User.objects.filter(
+            id=user_id, is_active=True).exists()
+        cache.set(key, is_active, settings.AUTH_USER_STATE_CACHE_SECONDS)
+    return is_active
+
+
+def clear_user_state_cache(user_id):
+    cache.delete(user_state_cache_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not is_user_active(user.id):
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive")
+        return user
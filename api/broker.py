@@ -0,0 +1,102 @@
+# in-process pub/sub used to push hunt and team events to connected clients.
+# good enough for a single node; swap EVENT_BROKER for something shared
+# (redis etc.) when running more than one process.
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+def hunt_channel(hunt_id):
+    return f"hunt:{hunt_id}"
+
+
+def team_channel(team_id):
+    return f"team:{team_id}"
+
+
+class Subscription:
+    def __init__(self, broker, channels, loop, max_pending):
+        self.broker = broker
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def push(self, message):
+        # publish() is called from sync worker threads, hand over to the loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # loop is gone, the client disconnected
+            self.broker.unsubscribe(self)
+
+    def _put(self, message):
+        if self.queue.full():
+            # slow client, drop the oldest event rather than block publishers
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channels, max_pending=100):
+        subscription = Subscription(
+            self, channels, asyncio.get_running_loop(), max_pending)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event, data):
+        message = {"event": event, "data": data}
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(
+                    getattr(settings, 'EVENT_BROKER', 'api.broker.LocalBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def publish_event(channel, event, data):
+    # only tell clients about changes that actually got committed
+    transaction.on_commit(
+        lambda: get_broker().publish(channel, event, data))
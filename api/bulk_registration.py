@@ -0,0 +1,221 @@
+# onboarding pre-formed teams from a csv with the columns
+#
+#   first_name,last_name,email,phone,password,team,leader
+#
+# rows with the same team end up in one team, its leader is the row with
+# leader set to yes/true/1 or else the first row. every row is checked
+# first and nothing is written unless all of them are fine. passwords are
+# hashed in a process pool since that is where nearly all the time goes.
+
+import csv
+import io
+import multiprocessing
+import os
+import random
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .hashers import hash_inline
+from .models import Hunt, LeaderboardEntry, Team, TeamMembership, User
+from .response_cache import bump_leaderboard_version, clear_hunt_responses
+from .usernames import allocate_usernames, username_base
+from .views.helpers import get_full_name
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'email', 'password', 'team')
+MAX_ROWS = 5000
+MIN_PASSWORD_LENGTH = 8
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+# below this hashing inline beats starting worker processes
+POOL_THRESHOLD = 16
+HASH_WORKERS = os.cpu_count() or 1
+
+
+class RegistrationError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+
+
+def read_rows(csv_file):
+    data = csv_file.read()
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise RegistrationError("The csv must be utf-8 encoded.")
+
+    reader = csv.DictReader(io.StringIO(data))
+    missing = [column for column in REQUIRED_COLUMNS
+               if column not in (reader.fieldnames or [])]
+    if missing:
+        raise RegistrationError(
+            "The csv is missing columns: " + ", ".join(missing))
+
+    rows = []
+    for row in reader:
+        rows.append({key: (value or '').strip()
+                     for key, value in row.items() if key is not None})
+        if len(rows) > MAX_ROWS:
+            raise RegistrationError(
+                f"A csv can have at most {MAX_ROWS} rows.")
+    if not rows:
+        raise RegistrationError("The csv has no rows.")
+    return rows
+
+
+def validate_rows(hunt, rows, usernames):
+    errors = []
+    # emails are unique ignoring case, whatever case they were stored in
+    registered = set(User.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in={row['email'].lower() for row in rows}
+    ).values_list('email_lower', flat=True))
+    username_length = User._meta.get_field('username').max_length
+    existing_teams = set(hunt.teams.filter(
+        name__in={row['team'] for row in rows}).values_list('name', flat=True))
+
+    seen = set()
+    for index, row in enumerate(rows):
+        row_errors = []
+        for column in REQUIRED_COLUMNS:
+            if not row[column]:
+                row_errors.append(f"{column} is required.")
+        for column in ('first_name', 'last_name', 'email', 'phone', 'team'):
+            if len(row.get(column, '')) > 100:
+                row_errors.append(f"{column} is too long.")
+        if len(usernames[index]) > username_length:
+            row_errors.append("first_name and last_name are too long together.")
+
+        email = row['email'].lower()
+        if email:
+            try:
+                validate_email(email)
+            except ValidationError:
+                row_errors.append("email is not valid.")
+            if email in registered:
+                row_errors.append("email is already registered.")
+            elif email in seen:
+                row_errors.append("email appears more than once.")
+            seen.add(email)
+
+        if row['password'] and len(row['password']) < MIN_PASSWORD_LENGTH:
+            row_errors.append(
+                f"password must be at least {MIN_PASSWORD_LENGTH} characters.")
+        if row['team'] in existing_teams:
+            row_errors.append("a team with this name already exists.")
+
+        if row_errors:
+            # line numbers as the organizer sees them, header is line 1
+            errors.append({"row": index + 2, "errors": row_errors})
+    if errors:
+        raise RegistrationError("The csv has invalid rows.", errors)
+
+
+def init_hash_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+    # the worker processes are the pool, no need for the hasher's threads
+    hash_inline()
+
+
+def hash_passwords(passwords):
+    if len(passwords) < POOL_THRESHOLD or HASH_WORKERS == 1:
+        return [make_password(password) for password in passwords]
+
+    # spawned rather than forked, a fork copies the request process's
+    # threads and locks (the hasher pool, db connections) in whatever state
+    # they happen to be
+    with ProcessPoolExecutor(
+            max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_hash_worker,
+            initargs=(os.environ['DJANGO_SETTINGS_MODULE'],)) as pool:
+        return list(pool.map(make_password, passwords,
+                             chunksize=max(1, len(passwords) // (HASH_WORKERS * 4))))
+
+
+def make_joining_password():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
+
+def group_teams(rows):
+    # {team name: (leader row index, [row indexes])}, in csv order
+    teams = {}
+    for index, row in enumerate(rows):
+        teams.setdefault(row['team'], []).append(index)
+
+    grouped = {}
+    for name, indexes in teams.items():
+        leaders = [i for i in indexes
+                   if rows[i].get('leader', '').lower() in TRUE_VALUES]
+        grouped[name] = (leaders[0] if leaders else indexes[0], indexes)
+    return grouped
+
+
+def register_teams(hunt, csv_file):
+    # returns the created teams, raises RegistrationError with per row
+    # errors before writing anything
+    rows = read_rows(csv_file)
+    usernames = allocate_usernames(
+        [username_base(row['first_name'], row['last_name']) for row in rows])
+    validate_rows(hunt, rows, usernames)
+    grouped = group_teams(rows)
+
+    password_hashes = hash_passwords([row['password'] for row in rows])
+
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=username, first_name=row['first_name'],
+                     last_name=row['last_name'],
+                     email=User.objects.normalize_email(row['email']),
+                     phone=row.get('phone') or None, password=password_hash)
+                for row, username, password_hash in zip(rows, usernames, password_hashes)
+            ])
+
+            teams = Team.objects.bulk_create([
+                Team(hunt=hunt, name=name, leader=users[leader],
+                     remaining_skips=hunt.number_of_skips_for_each_team,
+                     joining_password=make_joining_password())
+                for name, (leader, _) in grouped.items()
+            ])
+
+            memberships = []
+            team_members = []
+            for team, (_, indexes) in zip(teams, grouped.values()):
+                for index in indexes:
+                    memberships.append(TeamMembership(
+                        hunt=hunt, team=team, user=users[index]))
+                    team_members.append(Team.members.through(
+                        team_id=team.id, user_id=users[index].id))
+            TeamMembership.objects.bulk_create(memberships)
+            Team.members.through.objects.bulk_create(team_members)
+            Hunt.participants.through.objects.bulk_create([
+                Hunt.participants.through(hunt_id=hunt.id, user_id=user.id)
+                for user in users
+            ], ignore_conflicts=True)
+            LeaderboardEntry.objects.bulk_create([
+                LeaderboardEntry(hunt=hunt, team=team, team_name=team.name,
+                                 leader_name=get_full_name(team.leader),
+                                 points=team.points)
+                for team in teams
+            ])
+            bump_leaderboard_version(hunt.slug)
+    except IntegrityError:
+        # someone registered one of these emails or usernames meanwhile
+        raise RegistrationError(
+            "Some of these users or teams were created meanwhile, please try again.")
+
+    clear_hunt_responses(hunt.slug)
+    return [{
+        "name": team.name,
+        "joining_password": team.joining_password,
+        "leader": team.leader.email,
+        "members": [users[index].email for index in indexes],
+    } for team, (_, indexes) in zip(teams, grouped.values())]
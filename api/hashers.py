@@ -0,0 +1,93 @@
+# pbkdf2 with a cap on how many hashes run at once. right before a hunt
+# opens hundreds of logins arrive together, hashed inline on every request
+# thread they take all the cpu and puzzle polling stalls. here at most
+# PASSWORD_HASHING_WORKERS hashes run at a time. the hasher itself only
+# ever waits its turn, it also runs for the admin login, createsuperuser
+# and check_password outside of drf. the sign in and register views take a
+# hashing_slot() first, a few may wait and anything beyond that gets a 503
+# with Retry-After straight away.
+#
+# same algorithm name and format as django's PBKDF2PasswordHasher, existing
+# password hashes keep working.
+
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {"error": "Too many sign ins right now, please try again in a few seconds."}
+    default_code = 'hashing_busy'
+
+    def __init__(self, wait):
+        super().__init__()
+        # drf's exception handler turns this into Retry-After
+        self.wait = wait
+
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+# hash on the calling thread, for worker processes that are a pool already
+_inline = False
+
+
+def reset_pool():
+    # a forked child inherits the executor but not its threads, anything
+    # submitted there would wait forever
+    global _pool, _slots, _pool_lock
+    _pool = None
+    _slots = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_pool)
+
+
+def hash_inline():
+    global _inline
+    _inline = True
+
+
+def get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = settings.PASSWORD_HASHING_WORKERS or os.cpu_count() or 1
+                # running plus waiting
+                _slots = threading.BoundedSemaphore(
+                    workers + settings.PASSWORD_HASHING_QUEUE)
+                _pool = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='password-hashing')
+    return _pool, _slots
+
+
+@contextmanager
+def hashing_slot():
+    # load shedding for the api views, raises before any hashing starts
+    _, slots = get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy(settings.PASSWORD_HASHING_RETRY_AFTER)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # hashlib's pbkdf2 releases the gil, so a thread pool is enough to get
+    # real parallelism without a process pool's start up and pickling
+
+    def encode(self, password, salt, iterations=None):
+        if _inline:
+            return super().encode(password, salt, iterations)
+        pool, _ = get_pool()
+        return pool.submit(super().encode, password, salt, iterations).result()
@@ -0,0 +1,164 @@
+# smaller renditions of uploaded images, made on first request and kept on
+# disk under MEDIA_ROOT/variants/ so phones don't pull full size puzzle
+# images. files are keyed by a hash of the source content and the size, a
+# replaced upload gets fresh variants and stale ones are never served.
+
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .storage import get_content_hash
+
+# longest side in pixels
+VARIANT_SIZES = {
+    'thumb': 320,
+    'medium': 960,
+    'full': 1920,
+}
+VARIANT_DIR = 'variants'
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 50
+# only files the image fields upload to can be turned into variants
+SOURCE_DIRS = ('images/',)
+# exif orientations that swap width and height
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class InvalidVariant(Exception):
+    pass
+
+
+def is_variant_source(name):
+    name = os.path.normpath(name).replace(os.sep, '/')
+    return name.startswith(SOURCE_DIRS) and not name.startswith('../')
+
+
+def get_source_hash(name):
+    # content addressed names carry their hash already
+    content_hash = get_content_hash(name)
+    if content_hash is not None:
+        return content_hash
+
+    # older uploads: hash the whole file once per name, the result is
+    # memoized in the cache with the file's mtime so a replaced file is
+    # rehashed
+    mtime = default_storage.get_modified_time(name).timestamp()
+    key = f"image_source_hash:{name}"
+    cached = cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as source:
+        for chunk in source.chunks():
+            digest.update(chunk)
+    source_hash = digest.hexdigest()
+    cache.set(key, (mtime, source_hash), None)
+    return source_hash
+
+
+def get_source_size(name):
+    # (width, height) as displayed, after the exif rotation. only the header
+    # is read, memoized per content like the hash
+    key = f"image_source_size:{get_source_hash(name)}"
+    source_size = cache.get(key)
+    if source_size is None:
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            width, height = image.size
+            if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+        source_size = (width, height)
+        cache.set(key, source_size, None)
+    return source_size
+
+
+def variant_dimensions(source_size, size):
+    # scaled to fit the size's longest side, never upscaled. the renderer
+    # and the srcset widths both come from here
+    width, height = source_size
+    scale = min(1, VARIANT_SIZES[size] / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def variant_name(source_hash, size):
+    return f"{VARIANT_DIR}/{source_hash[:2]}/{source_hash}-{size}.webp"
+
+
+def render_variant(name, size, path):
+    with default_storage.open(name, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        dimensions = variant_dimensions(image.size, size)
+        if dimensions != image.size:
+            image = image.resize(
+                dimensions, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        # render next to the target and rename, concurrent requests for the
+        # same variant never see a half written file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def delete_variants(source_hash):
+    pattern = default_storage.path(variant_name(source_hash, '*'))
+    for path in glob.glob(pattern):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_variant(name, size):
+    # returns the storage name of the variant, rendering it if needed
+    if size not in VARIANT_SIZES or not is_variant_source(name):
+        raise InvalidVariant()
+    if not default_storage.exists(name):
+        raise InvalidVariant()
+
+    target = variant_name(get_source_hash(name), size)
+    path = default_storage.path(target)
+    if not os.path.exists(path):
+        render_variant(name, size, path)
+    return target
+
+
+def get_variant_urls(image):
+    # {size: url, ..., 'srcset': ...} for an image field, None when empty
+    if not image:
+        return None
+    urls = {
+        size: reverse('image-variant', kwargs={'size': size, 'name': image.name})
+        for size in VARIANT_SIZES
+    }
+    try:
+        source_size = get_source_size(image.name)
+    except OSError:
+        # missing or not an image, the variant urls 404 as well
+        urls['srcset'] = ''
+        return urls
+
+    # the widths the variants really have. a small source gives several
+    # sizes the same width, the smallest of them is enough
+    widths = {}
+    for size in VARIANT_SIZES:
+        widths.setdefault(variant_dimensions(source_size, size)[0], size)
+    urls['srcset'] = ', '.join(
+        f"{urls[size]} {width}w" for width, size in widths.items())
+    return urls
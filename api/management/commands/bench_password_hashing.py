@@ -0,0 +1,89 @@
+import statistics
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+
+from api.hashers import HashingBusy, PooledPBKDF2PasswordHasher, hashing_slot
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Simulate a login burst on a pool of request threads, once with "
+            "pbkdf2 hashed inline and once through the pooled hasher, while "
+            "a poller measures how responsive the rest of the app stays.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--request-threads', type=int, default=64,
+                            help="concurrent request workers, e.g. gunicorn threads")
+        parser.add_argument('--iterations', type=int,
+                            default=PBKDF2PasswordHasher.iterations)
+
+    def handle(self, *args, **options):
+        for label, hasher, admit in (('inline', PBKDF2PasswordHasher(), nullcontext),
+                                     ('pooled', PooledPBKDF2PasswordHasher(), hashing_slot)):
+            hasher.iterations = options['iterations']
+            result = self.run_burst(hasher, admit, options)
+            self.stdout.write(
+                f"{label:>6}: {result['ok']} logins ok, {result['rejected']} rejected (503) "
+                f"in {result['elapsed']:.1f}s, {result['ok'] / result['elapsed']:.1f} logins/s | "
+                f"login p50 {result['login_p50'] * 1000:.0f}ms p95 {result['login_p95'] * 1000:.0f}ms | "
+                f"poll p50 {result['poll_p50'] * 1000:.1f}ms p95 {result['poll_p95'] * 1000:.1f}ms")
+
+    def run_burst(self, hasher, admit, options):
+        encoded = hasher.encode('correct horse', hasher.salt())
+        login_times = []
+        rejected = []
+        done = threading.Event()
+        poll_times = []
+
+        def login():
+            started = time.perf_counter()
+            try:
+                # the way the sign in view admits requests
+                with admit():
+                    hasher.verify('correct horse', encoded)
+            except HashingBusy:
+                rejected.append(1)
+                return
+            login_times.append(time.perf_counter() - started)
+
+        def poll():
+            # stands in for a cheap puzzle polling request, timed from when
+            # it was due so waiting for the cpu or the gil counts as well
+            due = time.perf_counter()
+            while not done.is_set():
+                sum(i * i for i in range(20000))
+                poll_times.append(time.perf_counter() - due)
+                due = time.perf_counter() + 0.05
+                time.sleep(0.05)
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['request_threads']) as workers:
+            for _ in range(options['logins']):
+                workers.submit(login)
+        elapsed = time.perf_counter() - started
+        done.set()
+        poller.join()
+
+        return {
+            'ok': len(login_times),
+            'rejected': len(rejected),
+            'elapsed': elapsed,
+            'login_p50': statistics.median(login_times) if login_times else 0,
+            'login_p95': percentile(login_times, 0.95),
+            'poll_p50': statistics.median(poll_times) if poll_times else 0,
+            'poll_p95': percentile(poll_times, 0.95),
+        }
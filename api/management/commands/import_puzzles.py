@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Hunt
+from api.puzzle_import import BundleError, import_puzzles
+
+
+class Command(BaseCommand):
+    help = "Import puzzles into a hunt from a puzzles.json or zip bundle."
+
+    def add_arguments(self, parser):
+        parser.add_argument('hunt_slug')
+        parser.add_argument('bundle', help="path to puzzles.json or a zip")
+
+    def handle(self, *args, **options):
+        try:
+            hunt = Hunt.objects.get(slug=options['hunt_slug'])
+        except Hunt.DoesNotExist:
+            raise CommandError(f"No hunt with slug {options['hunt_slug']}.")
+
+        started = time.monotonic()
+        try:
+            with open(options['bundle'], 'rb') as bundle:
+                puzzles, images = import_puzzles(hunt, bundle)
+        except OSError as e:
+            raise CommandError(str(e))
+        except BundleError as e:
+            for error in e.errors:
+                self.stderr.write(str(error))
+            raise CommandError(e.message)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(puzzles)} puzzles with {len(images)} images "
+            f"in {time.monotonic() - started:.1f}s."))
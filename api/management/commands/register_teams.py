@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk_registration import RegistrationError, register_teams
+from api.models import Hunt
+
+
+class Command(BaseCommand):
+    help = "Register users and their teams for a hunt from a csv file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('hunt_slug')
+        parser.add_argument(
+            'csv', help="first_name,last_name,email,phone,password,team,leader")
+
+    def handle(self, *args, **options):
+        try:
+            hunt = Hunt.objects.get(slug=options['hunt_slug'])
+        except Hunt.DoesNotExist:
+            raise CommandError(f"No hunt with slug {options['hunt_slug']}.")
+
+        started = time.monotonic()
+        try:
+            with open(options['csv'], 'rb') as csv_file:
+                teams = register_teams(hunt, csv_file)
+        except OSError as e:
+            raise CommandError(str(e))
+        except RegistrationError as e:
+            for error in e.errors:
+                self.stderr.write(str(error))
+            raise CommandError(e.message)
+
+        for team in teams:
+            self.stdout.write(f"{team['name']}: {team['joining_password']}")
+        members = sum(len(team['members']) for team in teams)
+        self.stdout.write(self.style.SUCCESS(
+            f"Registered {len(teams)} teams with {members} users "
+            f"in {time.monotonic() - started:.1f}s."))
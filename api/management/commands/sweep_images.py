@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.storage import sweep_pending_deletions
+
+
+class Command(BaseCommand):
+    help = ("Delete released image files whose grace period is over and "
+            "that nothing references anymore. Releases do this on their own "
+            "too, run it from cron when uploads are rare.")
+
+    def handle(self, *args, **options):
+        checked = sweep_pending_deletions()
+        self.stdout.write(f"checked {checked} pending image deletions")
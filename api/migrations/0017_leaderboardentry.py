@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_leaderboard(apps, schema_editor):
+    Team = apps.get_model('api', 'Team')
+    LeaderboardEntry = apps.get_model('api', 'LeaderboardEntry')
+    PuzzleTimeMaintenance = apps.get_model('api', 'PuzzleTimeMaintenance')
+
+    last_solves = dict(
+        PuzzleTimeMaintenance.objects.filter(puzzle_end_time__isnull=False)
+        .values('team_id').annotate(last=models.Max('puzzle_end_time'))
+        .values_list('team_id', 'last'))
+    entries = []
+    for team in Team.objects.select_related('leader'):
+        entries.append(LeaderboardEntry(
+            hunt_id=team.hunt_id, team_id=team.id, team_name=team.name,
+            leader_name=f"{team.leader.first_name or ''} {team.leader.last_name or ''}".strip(),
+            points=team.points, last_solve_at=last_solves.get(team.id)))
+    LeaderboardEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_alter_hunt_poster_img_alter_puzzleimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team_name', models.CharField(max_length=100)),
+                ('leader_name', models.CharField(max_length=201)),
+                ('points', models.IntegerField(default=0)),
+                ('last_solve_at', models.DateTimeField(blank=True, null=True)),
+                ('hunt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='api.hunt')),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='api.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hunt', '-points', 'last_solve_at'], name='leaderboard_rank_idx')],
+            },
+        ),
+        migrations.RunPython(build_leaderboard, migrations.RunPython.noop),
+    ]
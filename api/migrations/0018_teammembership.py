@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_memberships(apps, schema_editor):
+    Team = apps.get_model('api', 'Team')
+    TeamMembership = apps.get_model('api', 'TeamMembership')
+
+    memberships = [
+        TeamMembership(hunt_id=hunt_id, team_id=team_id, user_id=user_id)
+        for team_id, hunt_id, user_id in Team.members.through.objects.values_list(
+            'team_id', 'team__hunt_id', 'user_id').order_by('id')
+    ]
+    # older data may have a user on two teams of a hunt, the first one wins
+    TeamMembership.objects.bulk_create(memberships, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hunt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.hunt')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.team')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='teammembership',
+            constraint=models.UniqueConstraint(fields=('hunt', 'user'), name='one_team_per_hunt'),
+        ),
+        migrations.RunPython(build_memberships, migrations.RunPython.noop),
+    ]
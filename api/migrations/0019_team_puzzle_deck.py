@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_teammembership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='puzzle_deck',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
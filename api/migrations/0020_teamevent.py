@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_team_puzzle_deck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'assigned'), (2, 'skipped'), (3, 'wrong answer'), (4, 'solved'), (5, 'hint received')])),
+                ('points', models.IntegerField(default=0)),
+                ('detail', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hunt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_events', to='api.hunt')),
+                ('puzzle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='team_events', to='api.puzzle')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='api.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hunt', 'team', 'created_at'], name='team_event_log_idx')],
+            },
+        ),
+    ]
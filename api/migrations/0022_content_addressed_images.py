@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:05
+
+import api.storage
+from django.db import migrations
+import django_resized.forms
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_announcement_feed_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hunt',
+            name='poster_img',
+            field=django_resized.forms.ResizedImageField(blank=True, crop=None, force_format='WEBP', keep_meta=True, null=True, quality=50, scale=None, size=[1920, 1080], storage=api.storage.get_image_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='huntimage',
+            name='image',
+            field=django_resized.forms.ResizedImageField(blank=True, crop=None, force_format='WEBP', keep_meta=True, null=True, quality=50, scale=None, size=[1920, 1080], storage=api.storage.get_image_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='puzzleimage',
+            name='image',
+            field=django_resized.forms.ResizedImageField(blank=True, crop=None, force_format='WEBP', keep_meta=True, null=True, quality=50, scale=None, size=[1920, 1080], storage=api.storage.get_image_storage, upload_to='images/'),
+        ),
+    ]
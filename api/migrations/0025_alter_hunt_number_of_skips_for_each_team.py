@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_pending_image_deletions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hunt',
+            name='number_of_skips_for_each_team',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,11 @@
 from django_resized import ResizedImageField
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 
 from django.contrib.auth.models import AbstractUser
 from .managers import UserManager
+from .storage import get_image_storage
 
 # Create your models here.
 
@@ -30,7 +32,7 @@ class Hunt(models.Model):
     end_date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     poster_img = ResizedImageField(
-        force_format='WEBP', quality=50, upload_to='images/', blank=True, null=True)
+        force_format='WEBP', quality=50, upload_to='images/', storage=get_image_storage, blank=True, null=True)
     number_of_skips_for_each_team = models.IntegerField(default=0)
 
     # Once user will create a hunt but after that, he/she can add other users as organizers
@@ -83,7 +85,10 @@ class Team(models.Model):
 
     # puzzle list
     puzzle_order_list = models.JSONField(default=list, blank=True, null=True)
-    # o indexed, applicable when puzzle_order_list is not empty.
+    # shuffled puzzle ids, used when there is no puzzle_order_list. built
+    # once on the team's first puzzle and consumed the same way.
+    puzzle_deck = models.JSONField(default=list, blank=True)
+    # o indexed, into puzzle_order_list or else puzzle_deck.
     current_puzzle_index = models.IntegerField(
         default=0, blank=True, null=True)
 
@@ -107,11 +112,31 @@ class Team(models.Model):
         return self.name
 
 
+# (hunt, user) -> team index, mirrors Team.members. the unique constraint is
+# what keeps a user on at most one team per hunt, even with concurrent joins.
+class TeamMembership(models.Model):
+    hunt = models.ForeignKey(
+        Hunt, on_delete=models.CASCADE, related_name='memberships')
+    team = models.ForeignKey(
+        Team, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='team_memberships')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hunt', 'user'], name='one_team_per_hunt'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.team}"
+
+
 class PuzzleImage(models.Model):
     puzzle = models.ForeignKey(
         Puzzle, on_delete=models.CASCADE, related_name='images')
     image = ResizedImageField(
-        force_format='WEBP', quality=50, upload_to='images/', blank=True, null=True)
+        force_format='WEBP', quality=50, upload_to='images/', storage=get_image_storage, blank=True, null=True)
 
     def __str__(self):
         return self.puzzle.name
@@ -139,6 +164,12 @@ class Announcement(models.Model):
     creator = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='announcements', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hunt', 'created_at'],
+                         name='announcement_feed_idx'),
+        ]
+
     def __str__(self):
         return self.text
 # for each puzzle, for each team
@@ -160,7 +191,7 @@ class HuntImage(models.Model):
     hunt = models.ForeignKey(
         Hunt, on_delete=models.CASCADE, related_name='images')
     image = ResizedImageField(
-        force_format='WEBP', quality=50, upload_to='images/', blank=True, null=True)
+        force_format='WEBP', quality=50, upload_to='images/', storage=get_image_storage, blank=True, null=True)
 
     def __str__(self):
         return self.hunt.name
@@ -173,3 +204,86 @@ class Rule(models.Model):
 
     def __str__(self):
         return self.rule
+
+
+# denormalized standings, kept in sync by the write paths so the leaderboard
+# never has to touch Team/User rows.
+class LeaderboardEntry(models.Model):
+    hunt = models.ForeignKey(
+        Hunt, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    team = models.OneToOneField(
+        Team, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    team_name = models.CharField(max_length=100)
+    leader_name = models.CharField(max_length=201)
+    points = models.IntegerField(default=0)
+    # earlier last solve wins a tie on points
+    last_solve_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hunt', '-points', 'last_solve_at'],
+                         name='leaderboard_rank_idx'),
+        ]
+
+    def __str__(self):
+        return self.team_name
+
+
+# append only log of what happened to a team, one row per action. team
+# progress and points can be replayed from it.
+class TeamEvent(models.Model):
+    ASSIGNED = 1
+    SKIPPED = 2
+    WRONG_ANSWER = 3
+    SOLVED = 4
+    HINT_RECEIVED = 5
+    KIND_CHOICES = [
+        (ASSIGNED, 'assigned'),
+        (SKIPPED, 'skipped'),
+        (WRONG_ANSWER, 'wrong answer'),
+        (SOLVED, 'solved'),
+        (HINT_RECEIVED, 'hint received'),
+    ]
+
+    hunt = models.ForeignKey(
+        Hunt, on_delete=models.CASCADE, related_name='team_events')
+    team = models.ForeignKey(
+        Team, on_delete=models.CASCADE, related_name='events')
+    puzzle = models.ForeignKey(
+        Puzzle, on_delete=models.CASCADE, related_name='team_events', null=True, blank=True)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    # points earned, for solves
+    points = models.IntegerField(default=0)
+    # the guess, for wrong answers
+    detail = models.CharField(max_length=100, blank=True)
+    # not auto_now_add, buffered events keep the time they happened
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hunt', 'team', 'created_at'],
+                         name='team_event_log_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.team} {self.get_kind_display()}"
+
+
+# version numbers behind the response cache keys and the polling ETags. in
+# the database rather than the cache so every process sees a bump right away.
+class VersionStamp(models.Model):
+    key = models.CharField(max_length=200, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} {self.version}"
+
+
+# image files released while an upload may still be about to use them,
+# deleted once due by release_image or the sweep_images command.
+class PendingImageDeletion(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    due_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,47 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from .models import Hunt
+from .views.helpers import get_request_hunt, is_hunt_organizer
+
+
+# raised straight from the permission so the response keeps the
+# {"error": ...} shape the frontend already handles.
+class InvalidHunt(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = {"error": "Invalid hunt slug."}
+    default_code = 'invalid_hunt'
+
+
+class NotHuntOrganizer(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = {"error": "You are not an organizer of this hunt."}
+    default_code = 'not_hunt_organizer'
+
+
+class IsHuntOrganizer(BasePermission):
+    # resolves the hunt from the url once and leaves it on request.hunt and
+    # request.is_hunt_organizer for the view.
+    def has_permission(self, request, view):
+        hunt_slug = view.kwargs.get('hunt_slug') or view.kwargs.get('slug')
+        try:
+            hunt = get_request_hunt(request, hunt_slug)
+        except Hunt.DoesNotExist:
+            raise InvalidHunt()
+
+        request.is_hunt_organizer = is_hunt_organizer(request.user, hunt)
+        if not self.allow_request(request):
+            raise NotHuntOrganizer()
+        return True
+
+    def allow_request(self, request):
+        return request.is_hunt_organizer
+
+
+class IsHuntOrganizerOrReadOnly(IsHuntOrganizer):
+    # reads skip the lookup entirely, so they can be served from cache
+    def has_permission(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        return super().has_permission(request, view)
@@ -0,0 +1,110 @@
+# writes to the TeamEvent log. wrong answers are buffered in memory and
+# inserted in batches so brute forcing an answer isn't an INSERT per guess.
+
+import atexit
+import os
+import threading
+
+from django.db import connection
+
+from .models import TeamEvent
+
+WRONG_ANSWER_BATCH_SIZE = 100
+# longest a buffered guess waits for its insert
+WRONG_ANSWER_FLUSH_SECONDS = 5
+
+_wrong_answers = []
+_wrong_answers_lock = threading.Lock()
+_flush_timer = None
+
+
+def reset_wrong_answers():
+    # a forked child would insert the parent's buffer a second time, and
+    # the parent's timer thread doesn't exist there
+    global _wrong_answers, _wrong_answers_lock, _flush_timer
+    _wrong_answers = []
+    _wrong_answers_lock = threading.Lock()
+    _flush_timer = None
+
+
+os.register_at_fork(after_in_child=reset_wrong_answers)
+
+
+def log_team_event(team, kind, puzzle=None, points=0, detail=''):
+    return TeamEvent.objects.create(
+        hunt_id=team.hunt_id, team_id=team.id,
+        puzzle_id=puzzle.id if puzzle else None,
+        kind=kind, points=points, detail=detail[:100])
+
+
+def log_wrong_answer(team, puzzle, answer):
+    global _flush_timer
+    event = TeamEvent(
+        hunt_id=team.hunt_id, team_id=team.id, puzzle_id=puzzle.id,
+        kind=TeamEvent.WRONG_ANSWER, detail=answer[:100])
+    with _wrong_answers_lock:
+        _wrong_answers.append(event)
+        due = len(_wrong_answers) >= WRONG_ANSWER_BATCH_SIZE
+        if not due and _flush_timer is None:
+            # the first guess of a batch starts the clock, so a quiet
+            # process still writes its buffer out
+            _flush_timer = threading.Timer(
+                WRONG_ANSWER_FLUSH_SECONDS, flush_wrong_answers_from_timer)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+    if due:
+        flush_wrong_answers()
+
+
+def flush_wrong_answers():
+    global _wrong_answers, _flush_timer
+    with _wrong_answers_lock:
+        events, _wrong_answers = _wrong_answers, []
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+    if events:
+        TeamEvent.objects.bulk_create(events)
+
+
+def flush_wrong_answers_from_timer():
+    try:
+        flush_wrong_answers()
+    finally:
+        # the timer thread's own connection
+        connection.close()
+
+
+# don't lose the tail of the buffer on a clean shutdown
+atexit.register(flush_wrong_answers)
+
+
+def replay_team_progress(team):
+    # rebuild a team's state from its log alone
+    flush_wrong_answers()
+    state = {
+        "current_puzzle": None,
+        "viewed_puzzles": [],
+        "solved_puzzles": [],
+        "skipped_puzzles": [],
+        "wrong_answers": 0,
+        "hints_received": 0,
+        "points": 0,
+    }
+    events = TeamEvent.objects.filter(hunt_id=team.hunt_id, team=team).order_by(
+        'created_at', 'id').values_list('kind', 'puzzle_id', 'points')
+    for kind, puzzle_id, points in events.iterator():
+        if kind == TeamEvent.ASSIGNED:
+            state["current_puzzle"] = puzzle_id
+            state["viewed_puzzles"].append(puzzle_id)
+        elif kind == TeamEvent.SKIPPED:
+            state["skipped_puzzles"].append(puzzle_id)
+        elif kind == TeamEvent.SOLVED:
+            state["solved_puzzles"].append(puzzle_id)
+            state["points"] += points
+        elif kind == TeamEvent.WRONG_ANSWER:
+            state["wrong_answers"] += 1
+        elif kind == TeamEvent.HINT_RECEIVED:
+            state["hints_received"] += 1
+    return state
+
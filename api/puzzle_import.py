@@ -0,0 +1,199 @@
+# bulk puzzle import. a bundle is either a puzzles.json file or a zip with
+# puzzles.json at its root and the images it references:
+#
+#   {"puzzles": [{"name": "...", "description": "...", "answer": "...",
+#                 "type": "easy", "points": 50, "images": ["p1/map.png"]}]}
+#
+# everything is validated before anything is written, images are resized
+# in a thread pool (pillow drops the GIL while encoding) and the rows go in
+# with bulk_create inside one transaction.
+
+import io
+import json
+import os
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Puzzle, PuzzleImage
+from .storage import release_image
+from .views.helpers import add_puzzles_to_decks, clear_puzzle_analytics_cache
+
+MANIFEST_NAME = 'puzzles.json'
+MAX_PUZZLES = 200
+MAX_IMAGES_PER_PUZZLE = 10
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# uncompressed, guards against zip bombs
+MAX_BUNDLE_BYTES = 500 * 1024 * 1024
+IMAGE_WORKERS = min(8, os.cpu_count() or 1)
+
+REQUIRED_FIELDS = ('name', 'description', 'type', 'answer')
+CHAR_FIELDS = ('name', 'answer', 'type')
+
+
+class BundleError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+
+
+def read_bundle(bundle):
+    # (manifest, {image path: bytes}) from an uploaded or opened file
+    data = bundle.read()
+    if not zipfile.is_zipfile(io.BytesIO(data)):
+        return parse_manifest(data), {}
+
+    try:
+        return read_zip_bundle(data)
+    except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError):
+        # corrupt entries (crc or size mismatch, truncated data) and
+        # compression methods the zipfile module can't read
+        raise BundleError("The zip is corrupt or uses an unsupported compression.")
+
+
+def read_zip_bundle(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        if sum(info.file_size for info in infos) > MAX_BUNDLE_BYTES:
+            raise BundleError("The bundle is too large.")
+        try:
+            manifest = parse_manifest(archive.read(MANIFEST_NAME))
+        except KeyError:
+            raise BundleError(f"The zip has no {MANIFEST_NAME} at its root.")
+
+        wanted = {path for puzzle in manifest if isinstance(puzzle, dict)
+                  for path in puzzle.get('images') or [] if isinstance(path, str)}
+        files = {}
+        for info in infos:
+            if info.filename in wanted and info.file_size <= MAX_IMAGE_BYTES:
+                files[info.filename] = archive.read(info)
+    return manifest, files
+
+
+def parse_manifest(data):
+    try:
+        manifest = json.loads(data)
+    except (ValueError, UnicodeDecodeError):
+        raise BundleError(f"{MANIFEST_NAME} is not valid json.")
+    if isinstance(manifest, dict):
+        manifest = manifest.get('puzzles')
+    if not isinstance(manifest, list) or not manifest:
+        raise BundleError("The bundle has no puzzles.")
+    if len(manifest) > MAX_PUZZLES:
+        raise BundleError(f"A bundle can have at most {MAX_PUZZLES} puzzles.")
+    return manifest
+
+
+def validate_puzzle(puzzle, files):
+    if not isinstance(puzzle, dict):
+        return ["Must be an object."]
+
+    errors = []
+    for field in REQUIRED_FIELDS:
+        value = puzzle.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{field} is required.")
+    for field in CHAR_FIELDS:
+        value = puzzle.get(field)
+        if isinstance(value, str) and len(value.strip()) > Puzzle._meta.get_field(field).max_length:
+            errors.append(f"{field} is too long.")
+
+    points = puzzle.get('points', 0)
+    if isinstance(points, bool) or not isinstance(points, int) or points < 0:
+        errors.append("points must be a non negative integer.")
+
+    images = puzzle.get('images') or []
+    if not isinstance(images, list):
+        return errors + ["images must be a list of paths."]
+    if len(images) > MAX_IMAGES_PER_PUZZLE:
+        errors.append(
+            f"A puzzle can have at most {MAX_IMAGES_PER_PUZZLE} images.")
+    for path in images:
+        if not isinstance(path, str) or path not in files:
+            errors.append(f"Image {path} is missing or too large.")
+            continue
+        try:
+            Image.open(io.BytesIO(files[path])).verify()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+            errors.append(f"Image {path} is not a valid image.")
+    return errors
+
+
+def validate_bundle(manifest, files):
+    errors = []
+    for index, puzzle in enumerate(manifest):
+        puzzle_errors = validate_puzzle(puzzle, files)
+        if puzzle_errors:
+            errors.append({"index": index, "errors": puzzle_errors})
+    if errors:
+        raise BundleError("The bundle has invalid puzzles.", errors)
+
+
+def process_image(path, data):
+    # same treatment ResizedImageField gives a single upload, then store it
+    field = PuzzleImage._meta.get_field('image')
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    image.thumbnail(field.size, Image.Resampling.LANCZOS)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    out = io.BytesIO()
+    image.save(out, field.force_format, quality=field.quality)
+
+    name = os.path.splitext(os.path.basename(path))[0] + '.webp'
+    return field.storage.save(
+        field.generate_filename(None, name), ContentFile(out.getvalue()))
+
+
+def import_puzzles(hunt, bundle):
+    # returns (puzzles, images) created, raises BundleError before writing
+    # anything when the bundle is not valid
+    manifest, files = read_bundle(bundle)
+    validate_bundle(manifest, files)
+
+    paths = sorted({path for puzzle in manifest
+                    for path in puzzle.get('images') or []})
+    stored = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=IMAGE_WORKERS) as pool:
+        futures = {path: pool.submit(process_image, path, files[path])
+                   for path in paths}
+        for path, future in futures.items():
+            try:
+                stored[path] = future.result()
+            except Exception:
+                failed.append(path)
+    if failed:
+        for name in stored.values():
+            release_image(name)
+        raise BundleError("Some images could not be processed.", [
+            {"image": path} for path in failed])
+
+    try:
+        with transaction.atomic():
+            puzzles = Puzzle.objects.bulk_create([
+                Puzzle(hunt=hunt, name=puzzle['name'].strip(),
+                       description=puzzle['description'],
+                       type=puzzle['type'].strip(),
+                       answer=puzzle['answer'].strip(),
+                       points=puzzle.get('points', 0))
+                for puzzle in manifest
+            ])
+            images = PuzzleImage.objects.bulk_create([
+                PuzzleImage(puzzle=created, image=stored[path])
+                for created, puzzle in zip(puzzles, manifest)
+                for path in puzzle.get('images') or []
+            ])
+            add_puzzles_to_decks(hunt, puzzles)
+            transaction.on_commit(
+                lambda: clear_puzzle_analytics_cache(hunt.id))
+    except Exception:
+        # files that didn't end up referenced by anything go away again
+        for name in stored.values():
+            release_image(name)
+        raise
+    return puzzles, images
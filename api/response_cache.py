@@ -0,0 +1,181 @@
+# per hunt cache for the public read endpoints. every hunt has a version
+# number per section, writes bump it and old entries just expire. the same
+# version stamps back the ETags of the polling endpoints. the stamps are
+# rows in the database, the cached responses can stay per process.
+
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import VersionStamp
+
+RESPONSE_SECTIONS = ('detail', 'rules', 'announcements', 'images')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_response_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    for section in RESPONSE_SECTIONS:
+        hits = stats.get(f"{section}_hits", 0)
+        misses = stats.get(f"{section}_misses", 0)
+        stats[f"{section}_hit_rate"] = hits / (hits + misses) if hits + misses else None
+    return stats
+
+
+def get_version_stamp(key):
+    # one lookup on a unique index. kept out of the cache on purpose, with
+    # the per process locmem default a bump would only be seen by the
+    # process that made it and the others would answer 304 for good.
+    version = VersionStamp.objects.filter(
+        key=key).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_version_stamp(key):
+    if VersionStamp.objects.filter(key=key).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            VersionStamp.objects.create(key=key, version=1)
+    except IntegrityError:
+        # created by a concurrent bump in the meantime
+        VersionStamp.objects.filter(key=key).update(version=F('version') + 1)
+
+
+def version_key(hunt_slug, section):
+    return f"response_version:{hunt_slug}:{section}"
+
+
+def get_section_version(hunt_slug, section):
+    return get_version_stamp(version_key(hunt_slug, section))
+
+
+def clear_hunt_responses(hunt_slug, *sections):
+    # no sections means everything, e.g. when the hunt itself changed
+    for section in sections or RESPONSE_SECTIONS:
+        bump_version_stamp(version_key(hunt_slug, section))
+
+
+def response_cache_key(request, hunt_slug, section):
+    version = get_section_version(hunt_slug, section)
+    query = request.GET.urlencode() if request.GET else ''
+    return f"response:{hunt_slug}:{section}:{version}:{query}"
+
+
+def get_cached_response(request, hunt_slug, section, build_response):
+    key = response_cache_key(request, hunt_slug, section)
+    data = cache.get(key)
+    if data is not None:
+        count(f"{section}_hits")
+        return Response(data)
+
+    count(f"{section}_misses")
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RESPONSE_CACHE_SECONDS)
+    return response
+
+
+def cache_hunt_response(section):
+    # for function views taking hunt_slug, goes under @api_view
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, hunt_slug, *args, **kwargs):
+            return get_cached_response(
+                request, hunt_slug, section,
+                lambda: view(request, hunt_slug, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+# version stamps for the polling endpoints
+
+def leaderboard_version_key(hunt_slug):
+    return f"leaderboard_version:{hunt_slug}"
+
+
+def team_progress_version_key(team_id):
+    return f"team_progress_version:{team_id}"
+
+
+def bump_leaderboard_version(hunt_slug):
+    # after commit, or a poll in between could pin the old body to the new tag
+    transaction.on_commit(
+        lambda: bump_version_stamp(leaderboard_version_key(hunt_slug)))
+
+
+def bump_team_progress_version(team_id):
+    transaction.on_commit(
+        lambda: bump_version_stamp(team_progress_version_key(team_id)))
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in tags or '*' in tags
+
+
+def get_conditional_response(request, get_etag, build_response):
+    # answers If-None-Match before anything expensive runs
+    etag = get_etag()
+    if is_not_modified(request, etag):
+        count("not_modified")
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    response = build_response()
+    # if the version moved while building (the view itself may have assigned
+    # a puzzle) the body can't be pinned to either tag, skip it this time
+    if response.status_code == 200 and get_etag() == etag:
+        response['ETag'] = etag
+    return response
+
+
+def etag_response(get_etag):
+    # for function views, goes under @api_view. get_etag gets the view's
+    # arguments and must be cheap, that's the whole point.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return get_conditional_response(
+                request, lambda: get_etag(request, *args, **kwargs),
+                lambda: view(request, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+def leaderboard_etag(request, hunt_slug):
+    version = get_version_stamp(leaderboard_version_key(hunt_slug))
+    return make_etag('leaderboard', hunt_slug, version, request.GET.urlencode())
+
+
+def announcements_etag(request, hunt_slug):
+    version = get_section_version(hunt_slug, 'announcements')
+    return make_etag('announcements', hunt_slug, version, request.GET.urlencode())
+
+
+def current_puzzle_etag(team):
+    version = get_version_stamp(team_progress_version_key(team.id))
+    return make_etag('current_puzzle', team.id, version)
@@ -1,5 +1,6 @@
 from .models import Hunt, User, Puzzle, PuzzleImage, HuntImage, Rule, Announcement
 from rest_framework import serializers
+from .image_variants import get_variant_urls
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -27,11 +28,15 @@ class UserDataSerializer(serializers.ModelSerializer):
 
 class HuntSerializer(serializers.ModelSerializer):
     organizers = UserDataSerializer(many=True, required=False)
+    poster_img_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Hunt
         fields = ['id', 'name', 'slug', 'description', 'start_date', 'end_date', 'created_at',
-                  'poster_img', 'number_of_skips_for_each_team', 'organizers', 'participants', 'payment_completed']
+                  'poster_img', 'poster_img_variants', 'number_of_skips_for_each_team', 'organizers', 'participants', 'payment_completed']
+
+    def get_poster_img_variants(self, hunt):
+        return get_variant_urls(hunt.poster_img)
 
 
 class PuzzleSerializer(serializers.ModelSerializer):
@@ -41,34 +46,100 @@ class PuzzleSerializer(serializers.ModelSerializer):
                   'description', 'answer', 'type', 'points']
 
 
-class PuzzleImageSerializer(serializers.ModelSerializer):
-    puzzle = PuzzleSerializer(many=False, required=False)
+def parse_fieldset(value):
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class ExpandableFieldsMixin:
+    # read side sparse fieldsets. relations listed in Meta.expandable_fields
+    # ({name: (serializer class, extra prefetch paths)}) come out as plain ids
+    # unless named in ?expand=, ?fields= keeps only the listed fields.
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = expand or set()
+        for name, (serializer_class, _) in self.Meta.expandable_fields.items():
+            if name in expand:
+                self.fields[name] = serializer_class(read_only=True)
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True)
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    @classmethod
+    def setup_queryset(cls, queryset, expand=None):
+        for name, (_, prefetch) in cls.Meta.expandable_fields.items():
+            if expand and name in expand:
+                queryset = queryset.select_related(name)
+                if prefetch:
+                    queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    @classmethod
+    def for_request(cls, request, queryset):
+        fields = parse_fieldset(request.query_params.get('fields'))
+        expand = parse_fieldset(request.query_params.get('expand'))
+        return cls(cls.setup_queryset(queryset, expand), many=True,
+                   fields=fields, expand=expand)
+
+
+EXPANDED_HUNT_PREFETCH = ['hunt__organizers', 'hunt__participants']
+
+
+class PuzzleImageSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = PuzzleImage
-        fields = ['id', 'puzzle', 'image']
+        fields = ['id', 'puzzle', 'image', 'image_variants']
+        expandable_fields = {'puzzle': (PuzzleSerializer, None)}
+
+    def get_image_variants(self, puzzle_image):
+        return get_variant_urls(puzzle_image.image)
 
 
-class HuntImageSerializer(serializers.ModelSerializer):
-    hunt = HuntSerializer(many=False, required=False)
+class HuntImageSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = HuntImage
-        fields = ['id', 'hunt', 'image']
+        fields = ['id', 'hunt', 'image', 'image_variants']
+        expandable_fields = {'hunt': (HuntSerializer, EXPANDED_HUNT_PREFETCH)}
 
+    def get_image_variants(self, hunt_image):
+        return get_variant_urls(hunt_image.image)
 
-class RuleSerializer(serializers.ModelSerializer):
-    hunt = HuntSerializer(many=False, required=False)
 
+class RuleSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Rule
         fields = ['id', 'hunt', 'rule']
+        expandable_fields = {'hunt': (HuntSerializer, EXPANDED_HUNT_PREFETCH)}
 
 
-class AnnouncementSerializer(serializers.ModelSerializer):
-    hunt = HuntSerializer(many=False, required=False)
-    creator = UserDataSerializer(many=False, required=False)
-
+class AnnouncementSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Announcement
         fields = ['id', 'hunt', 'text', 'creator', 'created_at']
+        expandable_fields = {
+            'hunt': (HuntSerializer, EXPANDED_HUNT_PREFETCH),
+            'creator': (UserDataSerializer, None),
+        }
+
+
+# lean rows for the incremental announcements feed
+class AnnouncementFeedSerializer(serializers.ModelSerializer):
+    creator_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Announcement
+        fields = ['id', 'text', 'created_at', 'creator_name']
+
+    def get_creator_name(self, announcement):
+        creator = announcement.creator
+        if creator is None:
+            return None
+        return f"{creator.first_name or ''} {creator.last_name or ''}".strip()
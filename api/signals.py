@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .authentication import clear_user_state_cache
+from .models import Hunt, HuntImage, PuzzleImage, User
+from .storage import release_image
+
+IMAGE_FIELDS = {Hunt: 'poster_img', PuzzleImage: 'image', HuntImage: 'image'}
+
+
+def remember_old_image(sender, instance, **kwargs):
+    # note the stored name before a save so a replaced image can be released
+    if instance.pk is None:
+        instance._old_image_name = None
+        return
+    field = IMAGE_FIELDS[sender]
+    instance._old_image_name = sender.objects.filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+def release_replaced_image(sender, instance, **kwargs):
+    old_name = getattr(instance, '_old_image_name', None)
+    if old_name and old_name != getattr(instance, IMAGE_FIELDS[sender]).name:
+        release_image(old_name)
+
+
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(getattr(instance, IMAGE_FIELDS[sender]).name)
+
+
+for model in IMAGE_FIELDS:
+    pre_save.connect(remember_old_image, sender=model)
+    post_save.connect(release_replaced_image, sender=model)
+    post_delete.connect(release_deleted_image, sender=model)
+
+
+def clear_user_state(sender, instance, **kwargs):
+    # deactivated or deleted accounts lose access right away
+    clear_user_state_cache(instance.id)
+
+
+post_save.connect(clear_user_state, sender=User)
+post_delete.connect(clear_user_state, sender=User)
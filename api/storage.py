@@ -0,0 +1,144 @@
+# content addressed storage for uploaded images. a file is saved under the
+# sha256 of its bytes, so uploading the same poster or puzzle image again
+# reuses the existing file instead of adding another copy. several rows can
+# then point at one file, see release_image for deleting them safely.
+
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # windows, only threads of one process are kept apart
+    fcntl = None
+
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/(?P<hash>[0-9a-f]{64})\.\w+$')
+
+
+def get_content_hash(name):
+    # the content hash a stored name was derived from, None for files
+    # uploaded before content addressing
+    match = HASHED_NAME_RE.search(name)
+    return match.group('hash') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        hashed_name = os.path.join(
+            directory, content_hash[:2], content_hash + extension).replace(os.sep, '/')
+        with image_lock():
+            if self.exists(hashed_name):
+                # touched so release_image leaves it alone until our row
+                # is committed
+                os.utime(self.path(hashed_name))
+                return hashed_name
+        # a concurrent upload of the same bytes can still win the race, the
+        # parent then picks a suffixed name and we keep one duplicate
+        return super()._save(hashed_name, content)
+
+    def get_available_name(self, name, max_length=None):
+        # the upload name is thrown away in _save, don't bother finding a
+        # free one
+        if get_content_hash(name) is None:
+            return name
+        return super().get_available_name(name, max_length)
+
+
+image_storage = ContentAddressedStorage()
+
+_image_lock = threading.Lock()
+
+
+@contextmanager
+def image_lock():
+    # reusing an existing file and deleting an unreferenced one exclude each
+    # other, across processes too through a lock file next to the images
+    with _image_lock:
+        os.makedirs(image_storage.location, exist_ok=True)
+        with open(os.path.join(image_storage.location, '.images.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+
+def get_image_storage():
+    # referenced by the model fields, keeps the instance out of migrations
+    return image_storage
+
+
+# reference counting. the image fields below may share files, one is only
+# removed once no row points at it anymore.
+
+def get_image_fields():
+    from .models import Hunt, HuntImage, PuzzleImage
+    return [(Hunt, 'poster_img'), (PuzzleImage, 'image'), (HuntImage, 'image')]
+
+
+def count_image_references(name):
+    return sum(model.objects.filter(**{field: name}).count()
+               for model, field in get_image_fields())
+
+
+def delete_if_unreferenced(name):
+    from .models import PendingImageDeletion
+
+    with image_lock():
+        if count_image_references(name) or not image_storage.exists(name):
+            PendingImageDeletion.objects.filter(name=name).delete()
+            return
+        age = time.time() - os.path.getmtime(image_storage.path(name))
+        grace = settings.IMAGE_RELEASE_GRACE_SECONDS
+        if age < grace:
+            # just reused by an upload whose row isn't visible yet, look
+            # again once that has had time to commit. kept in the db so a
+            # worker exiting in between doesn't leave the file behind.
+            PendingImageDeletion.objects.update_or_create(
+                name=name, defaults={
+                    'due_at': timezone.now() + timedelta(seconds=grace - age)})
+            return
+        image_storage.delete(name)
+        PendingImageDeletion.objects.filter(name=name).delete()
+
+    from .image_variants import delete_variants
+    content_hash = get_content_hash(name)
+    if content_hash is not None:
+        delete_variants(content_hash)
+
+
+def sweep_pending_deletions():
+    # returns how many files were looked at
+    from .models import PendingImageDeletion
+
+    names = list(PendingImageDeletion.objects.filter(
+        due_at__lte=timezone.now()).values_list('name', flat=True))
+    for name in names:
+        delete_if_unreferenced(name)
+    return len(names)
+
+
+def release_image(name):
+    # run after the row is gone, on commit so a rolled back delete keeps
+    # its file. earlier releases that have come due are handled on the way.
+    def release():
+        delete_if_unreferenced(name)
+        sweep_pending_deletions()
+
+    if name:
+        transaction.on_commit(release)
@@ -1,3 +1,259 @@
-from django.test import TestCase
+import io
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .bulk_registration import RegistrationError, register_teams
+from .models import Hint, Hunt, LeaderboardEntry, Puzzle, PuzzleTimeMaintenance, Team, TeamEvent, User
+from .progress import flush_wrong_answers
+from .views.helpers import add_puzzle_to_decks, create_leaderboard_entry, get_a_puzzle
+from .views.hunt_view import get_current_puzzle_response
+
+
+def run_in_threads(targets):
+    # every thread gets its own connection, all start together
+    barrier = threading.Barrier(len(targets))
+    results = []
+
+    def run(target):
+        try:
+            barrier.wait()
+            results.append(target())
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SubmitAnswerConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.leader = User.objects.create_user(
+            email='leader@example.com', username='leader', password='password',
+            first_name='Team', last_name='Leader')
+        self.member = User.objects.create_user(
+            email='member@example.com', username='member', password='password')
+        self.hunt = Hunt.objects.create(
+            name='Treasure Hunt', description='hunt', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=5))
+        self.puzzles = [Puzzle.objects.create(
+            hunt=self.hunt, name=f'puzzle {i}', description='puzzle',
+            answer=f'answer {i}', points=100) for i in range(2)]
+        self.team = Team.objects.create(
+            hunt=self.hunt, name='Team', leader=self.leader,
+            puzzle_order_list=[puzzle.id for puzzle in self.puzzles])
+        self.team.members.add(self.leader, self.member)
+        for user in (self.leader, self.member):
+            self.team.memberships.create(hunt=self.hunt, user=user)
+        create_leaderboard_entry(self.team, self.leader)
+
+        self.puzzle = self.puzzles[0]
+        PuzzleTimeMaintenance.objects.create(
+            puzzle=self.puzzle, team=self.team, puzzle_start_time=now)
+        self.team.current_puzzle = self.puzzle
+        self.team.current_puzzle_index = 1
+        self.team.save()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def submit(self):
+        return self.client_for(self.leader).post(
+            f'/api/{self.puzzle.id}/submit-answer/', {'answer': 'answer 0'}).status_code
+
+    def test_concurrent_correct_answers_award_points_once(self):
+        statuses = run_in_threads([self.submit] * 8)
+
+        self.assertEqual(statuses.count(200), 1)
+        self.assertEqual(statuses.count(400), 7)
+        self.assertEqual(TeamEvent.objects.filter(
+            team=self.team, kind=TeamEvent.SOLVED).count(), 1)
+        self.assertEqual(Team.objects.get(id=self.team.id).points, 100)
+        self.assertEqual(LeaderboardEntry.objects.get(team=self.team).points, 100)
+
+    def test_poll_with_stale_team_keeps_points(self):
+        # a member's poll loaded the team before the leader solved
+        stale_team = Team.objects.get(id=self.team.id)
+        self.assertEqual(self.submit(), 200)
+
+        response = get_current_puzzle_response(self.hunt, stale_team)
+
+        self.assertEqual(response.data['id'], self.puzzles[1].id)
+        self.assertEqual(Team.objects.get(id=self.team.id).points, 100)
+        self.assertEqual(LeaderboardEntry.objects.get(team=self.team).points, 100)
+
+    def test_concurrent_polls_and_submits_keep_points(self):
+        member = self.client_for(self.member)
+
+        def poll():
+            return member.get(
+                f'/api/{self.hunt.slug}/get-current-puzzle-view/').status_code
+
+        statuses = run_in_threads([poll, self.submit] * 4)
+
+        self.assertEqual(statuses.count(200), 5)
+        self.assertEqual(Team.objects.get(id=self.team.id).points,
+                         LeaderboardEntry.objects.get(team=self.team).points)
+
+    def test_leaderboard_etag_moves_for_every_process(self):
+        client = self.client_for(self.member)
+        url = f'/api/{self.hunt.slug}/leaderboard/'
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # solved through another process, with a cache of its own
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'other-process'}}):
+            self.assertEqual(self.submit(), 200)
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['points'], 100)
+
+
+    @mock.patch('api.progress.WRONG_ANSWER_FLUSH_SECONDS', 0.1)
+    def test_wrong_answers_are_flushed_without_another_guess(self):
+        flush_wrong_answers()
+        response = self.client_for(self.leader).post(
+            f'/api/{self.puzzle.id}/submit-answer/', {'answer': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+
+        wrong_answers = TeamEvent.objects.filter(team=self.team, kind=TeamEvent.WRONG_ANSWER)
+        deadline = time.monotonic() + 5
+        while not wrong_answers.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(list(wrong_answers.values_list('detail', flat=True)), ['wrong'])
+
+class PuzzleDeckTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        leader = User.objects.create_user(
+            email='leader@example.com', username='leader', password='password')
+        self.hunt = Hunt.objects.create(
+            name='Treasure Hunt', description='hunt', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=5))
+        for i in range(3):
+            Puzzle.objects.create(hunt=self.hunt, name=f'puzzle {i}', description='puzzle',
+                                  answer=f'answer {i}', points=100)
+        self.team = Team.objects.create(hunt=self.hunt, name='Team', leader=leader)
+
+    def test_assignment_keeps_puzzles_added_to_the_deck(self):
+        get_a_puzzle(self.hunt, self.team)
+        # the deck as a request loaded it, before the puzzle was created
+        stale_team = Team.objects.get(id=self.team.id)
+        puzzle = Puzzle.objects.create(hunt=self.hunt, name='late', description='puzzle',
+                                       answer='late', points=100)
+        add_puzzle_to_decks(self.hunt, puzzle)
+
+        get_a_puzzle(self.hunt, stale_team)
+
+        team = Team.objects.get(id=self.team.id)
+        self.assertIn(puzzle.id, team.puzzle_deck)
+        self.assertEqual(len(team.puzzle_deck), 4)
+        self.assertEqual(team.current_puzzle_index, 2)
+
+    def test_order_list_teams_get_no_deck(self):
+        self.team.puzzle_order_list = list(
+            self.hunt.puzzles.values_list('id', flat=True))
+        self.team.save()
+
+        get_a_puzzle(self.hunt, self.team)
+
+        self.assertEqual(Team.objects.get(id=self.team.id).puzzle_deck, [])
+
+
+    def test_deleted_puzzles_are_skipped(self):
+        get_a_puzzle(self.hunt, self.team)
+        team = Team.objects.get(id=self.team.id)
+        deleted = team.puzzle_deck[1]
+        Puzzle.objects.filter(id=deleted).delete()
+
+        puzzle = get_a_puzzle(self.hunt, team)
+
+        self.assertEqual(puzzle.id, team.puzzle_deck[2])
+        self.assertEqual(team.current_puzzle_index, 3)
+        self.assertIsNone(get_a_puzzle(self.hunt, team))
+
+
+class OrganizerScopeTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.organizer = User.objects.create_user(
+            email='organizer@example.com', username='organizer', password='password')
+        leader = User.objects.create_user(
+            email='leader@example.com', username='leader', password='password')
+        self.own_hunt, self.other_hunt = [Hunt.objects.create(
+            name=name, description='hunt', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=5)) for name in ('Own Hunt', 'Other Hunt')]
+        self.own_hunt.organizers.add(self.organizer)
+        self.other_team = Team.objects.create(hunt=self.other_hunt, name='Team', leader=leader)
+        self.other_puzzle = Puzzle.objects.create(
+            hunt=self.other_hunt, name='puzzle', description='puzzle', answer='answer', points=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.organizer)
+
+    def test_puzzle_order_for_another_hunts_team(self):
+        response = self.client.post(
+            f'/api/{self.own_hunt.slug}/{self.other_team.id}/create-puzzle-order/',
+            {'list': [self.other_puzzle.id]}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Team.objects.get(id=self.other_team.id).puzzle_order_list, [])
+
+    def test_hint_for_another_hunts_team(self):
+        response = self.client.post(
+            f'/api/{self.own_hunt.slug}/{self.other_team.id}/{self.other_puzzle.id}/add-hint/',
+            {'text': 'look up'})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Hint.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkRegistrationTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.hunt = Hunt.objects.create(
+            name='Treasure Hunt', description='hunt', start_date=now + timedelta(hours=1),
+            end_date=now + timedelta(hours=5))
+
+    def register(self, *rows):
+        lines = ['first_name,last_name,email,phone,password,team']
+        lines += [','.join(row) for row in rows]
+        return register_teams(self.hunt, io.BytesIO('\n'.join(lines).encode()))
+
+    def row_errors(self, *rows):
+        with self.assertRaises(RegistrationError) as raised:
+            self.register(*rows)
+        return raised.exception.errors
+
+    def test_registered_email_in_another_case(self):
+        User.objects.create_user(
+            email='Player@Example.com', username='player', password='password')
+
+        errors = self.row_errors(('New', 'Player', 'player@example.com', '1', 'password', 'Team'))
+
+        self.assertEqual(errors, [{"row": 2, "errors": ["email is already registered."]}])
+
+    def test_username_too_long(self):
+        errors = self.row_errors(
+            ('a' * 60, 'b' * 60, 'long@example.com', '1', 'password', 'Team'),
+            ('Short', 'Name', 'short@example.com', '1', 'password', 'Team'))
+
+        self.assertEqual(errors, [{"row": 2, "errors": ["first_name and last_name are too long together."]}])
+        self.assertFalse(User.objects.exists())
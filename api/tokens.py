@@ -0,0 +1,171 @@
+# refresh tokens with a bloom filter in front of the blacklist lookup.
+# every refresh used to join outstanding and blacklisted tokens just to
+# learn that a fresh token isn't blacklisted. the filter holds the jti of
+# every blacklisted token, a miss means not blacklisted for sure and only
+# hits go to the database.
+#
+# the filter lives in the process and answers negatives from memory. rows
+# blacklisted by other processes are pulled in every
+# TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS, a rotated token reused in between is
+# still caught by the unique insert in BloomRefreshToken.blacklist().
+
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from rest_framework_simplejwt.views import TokenRefreshView
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        # double hashing over one sha256
+        digest = hashlib.sha256(value.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(value))
+
+
+class BlacklistFilter:
+    # the process wide filter, topped up with new rows on a short schedule
+    # and rebuilt from scratch now and then so rows removed by
+    # purge_token_blacklist stop causing false positives
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.last_id = 0
+        self.built_at = 0
+        self.synced_at = 0
+
+    def rebuild(self):
+        rows = list(BlacklistedToken.objects.values_list('id', 'token__jti'))
+        capacity = max(settings.TOKEN_BLACKLIST_BLOOM_CAPACITY, len(rows) * 2)
+        bloom = BloomFilter(capacity, settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE)
+        for row_id, jti in rows:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.last_id = max((row_id for row_id, jti in rows), default=0)
+        self.built_at = self.synced_at = time.monotonic()
+
+    def sync(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self.synced_at < settings.TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS:
+            return
+        with self.lock:
+            if (self.bloom is None
+                    or self.bloom.count >= self.bloom.capacity
+                    or now - self.built_at > settings.TOKEN_BLACKLIST_BLOOM_REBUILD_SECONDS):
+                self.rebuild()
+            elif now - self.synced_at >= settings.TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS:
+                for row_id, jti in BlacklistedToken.objects.filter(
+                        id__gt=self.last_id).values_list('id', 'token__jti'):
+                    self.bloom.add(jti)
+                    self.last_id = max(self.last_id, row_id)
+                self.synced_at = now
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+
+blacklist_filter = BlacklistFilter()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record_check(name, seconds):
+    with _stats_lock:
+        _stats[name] += 1
+        _stats["check_seconds"] += seconds
+        _stats["check_max_ms"] = max(_stats["check_max_ms"], seconds * 1000)
+
+
+def get_token_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    checks = stats.get("bloom_negative", 0) + stats.get("db_checked", 0)
+    stats["checks"] = checks
+    stats["check_avg_ms"] = stats.pop("check_seconds", 0) / checks * 1000 if checks else None
+    stats["outstanding_tokens"] = OutstandingToken.objects.count()
+    stats["expired_outstanding_tokens"] = OutstandingToken.objects.filter(
+        expires_at__lte=timezone.now()).count()
+    stats["blacklisted_tokens"] = BlacklistedToken.objects.count()
+    bloom = blacklist_filter.bloom
+    if bloom is not None:
+        stats["bloom_entries"] = bloom.count
+        stats["bloom_capacity"] = bloom.capacity
+    return stats
+
+
+class BloomRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        started = time.perf_counter()
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not blacklist_filter.might_contain(jti):
+            record_check("bloom_negative", time.perf_counter() - started)
+            return
+        try:
+            super().check_blacklist()
+        finally:
+            record_check("db_checked", time.perf_counter() - started)
+
+    def blacklist(self):
+        # create instead of get_or_create, a unique violation means a
+        # concurrent refresh already used this token
+        jti = self.payload[api_settings.JTI_CLAIM]
+        token, created = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "token": str(self),
+                "expires_at": datetime_from_epoch(self.payload["exp"]),
+            },
+        )
+        try:
+            with transaction.atomic():
+                blacklisted = BlacklistedToken.objects.create(token=token)
+        except IntegrityError:
+            raise TokenError(_("Token is blacklisted"))
+        blacklist_filter.add(jti)
+        return blacklisted
+
+
+class BloomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = BloomRefreshToken
+
+
+class BloomTokenRefreshView(TokenRefreshView):
+    serializer_class = BloomTokenRefreshSerializer
@@ -1,8 +1,6 @@
 from django.urls import path
-from .views.auth_view import MyTokenObtainPairView, register
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
+from .views.auth_view import MyTokenObtainPairView, register, token_stats
+from .tokens import BloomTokenRefreshView
 
 from .views.hunt_view import (
     create_hunt,
@@ -14,7 +12,6 @@ from .views.hunt_view import (
     get_next_or_skip_puzzle,
     submit_answer,
     get_leaderboard,
-    get_announcements,
     add_announcements,
     add_hint,
     get_hints,
@@ -28,7 +25,22 @@ from .views.hunt_view import (
     get_all_teams_data,
     get_all_puzzles_of_a_hunt,
     get_recent_hunts,
-    is_hunt_paid_for
+    is_hunt_paid_for,
+    get_cache_stats,
+)
+
+from .views.stream_view import hunt_events, announcements
+
+from .views.media_view import get_image_variant
+
+from .views.dashboard_view import (
+    create_puzzle_orders,
+    export_results,
+    get_puzzle_analytics,
+    rescore_teams,
+    get_team_progress_log,
+    import_puzzle_bundle,
+    register_teams_from_csv,
 )
 
 from .views.frontend_helpers import (
@@ -42,7 +54,7 @@ from .views.frontend_helpers import (
 urlpatterns = [
     # auth
     path("token/", MyTokenObtainPairView.as_view()),
-    path("token/refresh/", TokenRefreshView.as_view()),
+    path("token/refresh/", BloomTokenRefreshView.as_view()),
     path("register/", register, name="register"),
 
     # hunt
@@ -60,7 +72,8 @@ urlpatterns = [
     path("<slug:hunt_slug>/puzzle/<str:type_param>/", get_next_or_skip_puzzle),
     path("<int:puzzle_id>/submit-answer/", submit_answer),
     path("<slug:hunt_slug>/leaderboard/", get_leaderboard),
-    path("<slug:hunt_slug>/announcements/", get_announcements),
+    path("<slug:hunt_slug>/announcements/", announcements),
+    path("<slug:hunt_slug>/events/", hunt_events),
     path("<slug:hunt_slug>/<int:team_id>/<int:puzzle_id>/add-hint/", add_hint),
     path("<int:team_id>/<int:puzzle_id>/get-hints/", get_hints),
     path("<int:puzzle_id>/get-puzzle-images/", get_puzzle_images),
@@ -69,6 +82,10 @@ urlpatterns = [
     path("<slug:hunt_slug>/get-hunt-images/", get_hunt_images),
     path("<slug:hunt_slug>/post-hunt-images/", post_hunt_images),
 
+    # responsive image renditions, generated on first request
+    path("image-variants/<str:size>/<path:name>",
+         get_image_variant, name="image-variant"),
+
     # other hunt info
     path("<slug:hunt_slug>/get-rules/", get_rules),
 
@@ -85,9 +102,18 @@ urlpatterns = [
     path("<slug:hunt_slug>/add-announcement/", add_announcements),
     path("<slug:hunt_slug>/<int:team_id>/create-puzzle-order/",
          create_puzzle_order_for_a_team),
+    path("<slug:hunt_slug>/create-puzzle-orders/", create_puzzle_orders),
+    path("<slug:hunt_slug>/export-results/", export_results),
+    path("<slug:hunt_slug>/import-puzzles/", import_puzzle_bundle),
+    path("<slug:hunt_slug>/register-teams/", register_teams_from_csv),
+    path("<slug:hunt_slug>/puzzle-analytics/", get_puzzle_analytics),
+    path("<slug:hunt_slug>/rescore/", rescore_teams),
+    path("<slug:hunt_slug>/<int:team_id>/progress-log/", get_team_progress_log),
     path("<slug:hunt_slug>/get-all-teams-data/", get_all_teams_data),
     path("<slug:hunt_slug>/get-all-puzzles/", get_all_puzzles_of_a_hunt),
 
     path("<slug:hunt_slug>/is-hunt-paid-for/", is_hunt_paid_for),
+    path("cache-stats/", get_cache_stats),
+    path("token-stats/", token_stats),
 
 ]
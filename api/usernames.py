@@ -0,0 +1,81 @@
+# usernames are first.last, then first.last.1, first.last.2 ... for
+# namesakes. the next free suffix comes from one prefix query instead of
+# probing names one exists() at a time.
+
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import User
+
+# keeps each OR'd prefix query well below sqlite's expression limits
+PREFIX_QUERY_BATCH = 200
+
+
+def username_base(first_name, last_name):
+    return f"{first_name.lower()}.{last_name.lower()}"
+
+
+def get_taken_usernames(bases):
+    # {base: (bare base taken, highest numeric suffix or 0)}
+    bases = sorted(set(bases))
+    taken = {base: (False, 0) for base in bases}
+    for i in range(0, len(bases), PREFIX_QUERY_BATCH):
+        batch = bases[i:i + PREFIX_QUERY_BATCH]
+        query = Q(username__in=batch)
+        for base in batch:
+            # a range rather than startswith, LIKE can't use the unique
+            # index on sqlite. '/' sorts right after '.'
+            query |= Q(username__gte=f"{base}.", username__lt=f"{base}/")
+        for username in User.objects.filter(query).values_list('username', flat=True):
+            update_taken(taken, username)
+    return taken
+
+
+def update_taken(taken, username):
+    if username in taken:
+        taken[username] = (True, taken[username][1])
+    base, _, suffix = username.rpartition('.')
+    if base in taken and re.fullmatch(r'\d+', suffix):
+        bare, highest = taken[base]
+        taken[base] = (bare, max(highest, int(suffix)))
+
+
+def allocate_usernames(bases):
+    # one free username per entry of bases, in order, repeats included
+    taken = get_taken_usernames(bases)
+    usernames = []
+    for base in bases:
+        bare, highest = taken[base]
+        if not bare:
+            usernames.append(base)
+            taken[base] = (True, highest)
+        else:
+            usernames.append(f"{base}.{highest + 1}")
+            taken[base] = (True, highest + 1)
+    return usernames
+
+
+def allocate_username(first_name, last_name):
+    return allocate_usernames([username_base(first_name, last_name)])[0]
+
+
+# a concurrent sign up can take the allocated name between the query and
+# the insert, the unique constraint catches that and we allocate again
+USERNAME_RETRIES = 5
+
+
+def create_user_with_username(first_name, last_name, **fields):
+    for attempt in range(USERNAME_RETRIES):
+        username = allocate_username(first_name, last_name)
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(
+                    username=username, first_name=first_name,
+                    last_name=last_name, **fields)
+        except IntegrityError:
+            # something else (the email) clashed, retrying won't help
+            if attempt == USERNAME_RETRIES - 1 or not User.objects.filter(
+                    username=username).exists():
+                raise
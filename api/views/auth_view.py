@@ -1,5 +1,8 @@
-from ..models import User
+from django.db import IntegrityError
+
+from ..hashers import hashing_slot
 from ..serializers import UserRegisterSerializer
+from ..usernames import create_user_with_username
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -7,10 +10,14 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+
+from ..tokens import BloomRefreshToken, get_token_stats
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = BloomRefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -20,6 +27,9 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token["first_name"] = user.first_name
         token["last_name"] = user.last_name
         token["phone"] = user.phone
+        # request.user is built from these claims, see api/authentication.py
+        token["is_staff"] = user.is_staff
+        token["is_superuser"] = user.is_superuser
 
         return token
 
@@ -27,6 +37,10 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        with hashing_slot():
+            return super().post(request, *args, **kwargs)
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -39,12 +53,6 @@ def register(request):
         password = serializer.validated_data["password"]
         phone = serializer.validated_data["phone"]
 
-        username = f"{first_name.lower()}.{last_name.lower()}"
-        num = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{first_name.lower()}.{last_name.lower()}.{num}"
-            num += 1
-
         if len(password) < 8:
             return Response(
                 {"error": "Password must be at least 8 characters"},
@@ -56,14 +64,20 @@ def register(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        User.objects.create_user(
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            password=password,
-            phone=phone,
-        )
+        try:
+            with hashing_slot():
+                create_user_with_username(
+                    first_name,
+                    last_name,
+                    email=email,
+                    password=password,
+                    phone=phone,
+                )
+        except IntegrityError:
+            return Response(
+                {"error": "user with this email already exists."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         return Response({
             "message": "User created successfully"
         }, status=status.HTTP_201_CREATED)
@@ -74,3 +88,9 @@ def register(request):
         )
 
     return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def token_stats(request):
+    return Response(get_token_stats())
@@ -0,0 +1,451 @@
+# bulk tools for the organizer dashboard
+
+import csv
+import json
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from ..broker import publish_event, hunt_channel
+from ..bulk_registration import RegistrationError, register_teams
+from ..models import Team, PuzzleTimeMaintenance, LeaderboardEntry, TeamEvent
+from ..progress import flush_wrong_answers, replay_team_progress
+from ..puzzle_import import BundleError, import_puzzles
+from ..response_cache import bump_leaderboard_version
+from ..permissions import IsHuntOrganizer
+from .helpers import GRACE_PERIOD, DEDUCTION_RATE, MIN_POINTS_FRACTION, get_invalid_puzzle_ids, generate_puzzle_orders, count_points, get_full_name, puzzle_analytics_cache_key, rescore_hunt, clear_puzzle_analytics_cache
+
+
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def create_puzzle_orders(request, hunt_slug):
+    # either {"orders": {"<team_id>": [puzzle ids], ...}} or
+    # {"generate": "latin" | "rotated", "puzzle_ids": [optional subset]}
+    hunt = request.hunt
+    orders = request.data.get('orders')
+    mode = request.data.get('generate')
+
+    if orders:
+        if not isinstance(orders, dict):
+            return Response(
+                {"error": "orders must map team ids to puzzle id lists."},
+                status=status.HTTP_400_BAD_REQUEST,)
+        try:
+            orders = {int(team_id): order for team_id, order in orders.items()}
+        except ValueError:
+            return Response(
+                {"error": "Invalid team id."},
+                status=status.HTTP_400_BAD_REQUEST,)
+        if not all(isinstance(order, list) and order for order in orders.values()):
+            return Response(
+                {"error": "Please provide a list for every team."},
+                status=status.HTTP_400_BAD_REQUEST,)
+
+        teams = list(hunt.teams.filter(id__in=orders.keys()).only('id'))
+        if len(teams) != len(orders):
+            found = {team.id for team in teams}
+            return Response({
+                "error": "Invalid team id.",
+                "team_ids": sorted(set(orders) - found),
+            }, status=status.HTTP_400_BAD_REQUEST,)
+
+        all_puzzle_ids = [pid for order in orders.values() for pid in order]
+        invalid = get_invalid_puzzle_ids(hunt, all_puzzle_ids)
+        if invalid:
+            return Response({
+                "error": "Invalid puzzle id.",
+                "puzzle_ids": invalid,
+            }, status=status.HTTP_400_BAD_REQUEST,)
+        for team in teams:
+            team.puzzle_order_list = [int(pid) for pid in orders[team.id]]
+
+    elif mode in ('latin', 'rotated'):
+        puzzle_ids = request.data.get('puzzle_ids')
+        if puzzle_ids:
+            invalid = get_invalid_puzzle_ids(hunt, puzzle_ids)
+            if invalid:
+                return Response({
+                    "error": "Invalid puzzle id.",
+                    "puzzle_ids": invalid,
+                }, status=status.HTTP_400_BAD_REQUEST,)
+            puzzle_ids = [int(pid) for pid in puzzle_ids]
+        else:
+            puzzle_ids = list(hunt.puzzles.order_by(
+                'id').values_list('id', flat=True))
+        if not puzzle_ids:
+            return Response(
+                {"error": "This hunt has no puzzles yet."},
+                status=status.HTTP_400_BAD_REQUEST,)
+
+        teams = list(hunt.teams.order_by('id').only('id'))
+        for team, order in zip(teams, generate_puzzle_orders(puzzle_ids, len(teams), mode)):
+            team.puzzle_order_list = order
+
+    else:
+        return Response(
+            {"error": "Please provide the orders or a generate mode (latin or rotated)."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    with transaction.atomic():
+        Team.objects.bulk_update(teams, ['puzzle_order_list'], batch_size=500)
+
+    return Response({
+        "success": "Puzzle order created for " + str(len(teams)) + " teams.",
+        "orders": {team.id: team.puzzle_order_list for team in teams},
+    }, status=status.HTTP_201_CREATED)
+
+
+EXPORT_COLUMNS = [
+    'team_id', 'team_name', 'team_leader', 'team_members', 'team_points',
+    'skips_used', 'puzzle_id', 'puzzle_name', 'puzzle_start_time',
+    'puzzle_end_time', 'puzzle_points',
+]
+
+
+class Echo:
+    # csv.writer only needs something with write(), hand the line back
+    def write(self, value):
+        return value
+
+
+def iter_result_rows(hunt):
+    members = {}
+    for team_id, email in Team.members.through.objects.filter(
+            team__hunt=hunt).values_list('team_id', 'user__email').iterator():
+        members.setdefault(team_id, []).append(email)
+
+    def team_columns(team):
+        return {
+            'team_id': team.id,
+            'team_name': team.name,
+            'team_leader': get_full_name(team.leader),
+            'team_members': ";".join(members.get(team.id, [])),
+            'team_points': team.points,
+            'skips_used': hunt.number_of_skips_for_each_team - team.remaining_skips,
+        }
+
+    time_rows = PuzzleTimeMaintenance.objects.filter(
+        team__hunt=hunt).select_related('team__leader', 'puzzle').order_by(
+        'team_id', 'puzzle_start_time')
+    for row in time_rows.iterator(chunk_size=2000):
+        puzzle = row.puzzle
+        solved = row.puzzle_start_time and row.puzzle_end_time
+        yield {
+            **team_columns(row.team),
+            'puzzle_id': puzzle.id,
+            'puzzle_name': puzzle.name,
+            'puzzle_start_time': row.puzzle_start_time,
+            'puzzle_end_time': row.puzzle_end_time,
+            'puzzle_points': count_points(puzzle, row, hunt=hunt) if solved else 0,
+        }
+
+    # teams that never got a puzzle still belong in the results
+    idle_teams = hunt.teams.filter(time_maintenance__isnull=True).select_related(
+        'leader').order_by('id')
+    for team in idle_teams.iterator(chunk_size=2000):
+        yield {
+            **team_columns(team),
+            'puzzle_id': None,
+            'puzzle_name': None,
+            'puzzle_start_time': None,
+            'puzzle_end_time': None,
+            'puzzle_points': 0,
+        }
+
+
+def stream_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+@api_view(['GET'])
+@permission_classes([IsHuntOrganizer])
+def export_results(request, hunt_slug):
+    # ?output=csv (default) or ?output=ndjson. "format" is taken by DRF.
+    hunt = request.hunt
+    output = request.query_params.get('output', 'csv')
+    if output == 'csv':
+        response = StreamingHttpResponse(
+            stream_csv(iter_result_rows(hunt)), content_type='text/csv')
+    elif output == 'ndjson':
+        response = StreamingHttpResponse(
+            stream_ndjson(iter_result_rows(hunt)), content_type='application/x-ndjson')
+    else:
+        return Response(
+            {"error": "output must be csv or ndjson."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    response['Content-Disposition'] = f'attachment; filename="{hunt.slug}-results.{output}"'
+    return response
+
+
+# solves clear the cache right away, views and skips just age out
+PUZZLE_ANALYTICS_CACHE_SECONDS = 60
+
+
+# (key, percentile), nearest rank
+SOLVE_DURATION_PERCENTILES = (('median_solve_seconds', 0.5), ('p90_solve_seconds', 0.9))
+
+
+def get_percentile_rank(percentile, solves):
+    return max(math.ceil(percentile * solves), 1)
+
+
+def get_solve_duration_percentiles(hunt, solve_counts):
+    # {puzzle id: {key: seconds}} for every puzzle in one query. the solves
+    # are numbered per puzzle by duration and only the rows sitting at one
+    # of the wanted ranks come back.
+    wanted = {get_percentile_rank(percentile, solves)
+              for solves in solve_counts.values() if solves
+              for _, percentile in SOLVE_DURATION_PERCENTILES}
+    if not wanted:
+        return {}
+    duration = ExpressionWrapper(
+        F('puzzle_end_time') - F('puzzle_start_time'), output_field=DurationField())
+    rows = PuzzleTimeMaintenance.objects.filter(
+        puzzle__hunt=hunt, puzzle_start_time__isnull=False,
+        puzzle_end_time__isnull=False).annotate(
+        duration=duration,
+        rank=Window(RowNumber(), partition_by=[F('puzzle_id')],
+                    order_by=[duration.asc(), F('id').asc()]),
+    ).filter(rank__in=wanted).values_list('puzzle_id', 'rank', 'duration')
+
+    durations = {(puzzle_id, rank): value for puzzle_id, rank, value in rows}
+    percentiles = {}
+    for puzzle_id, solves in solve_counts.items():
+        if not solves:
+            continue
+        percentiles[puzzle_id] = {}
+        for key, percentile in SOLVE_DURATION_PERCENTILES:
+            value = durations.get((puzzle_id, get_percentile_rank(percentile, solves)))
+            percentiles[puzzle_id][key] = value.total_seconds() if value is not None else None
+    return percentiles
+
+
+def compute_puzzle_analytics(hunt):
+    solved = Q(time_maintenance__puzzle_end_time__isnull=False)
+    # given to a team, not solved and no longer their current puzzle
+    skipped = Q(time_maintenance__puzzle_end_time__isnull=True) & ~Q(
+        time_maintenance__team__current_puzzle=F('id'))
+    duration = ExpressionWrapper(
+        F('time_maintenance__puzzle_end_time') - F('time_maintenance__puzzle_start_time'),
+        output_field=DurationField())
+
+    puzzles = hunt.puzzles.annotate(
+        views=Count('time_maintenance'),
+        solves=Count('time_maintenance', filter=solved),
+        skips=Count('time_maintenance', filter=skipped),
+        average_duration=Avg(duration, filter=solved),
+    ).order_by('id').values('id', 'name', 'points', 'views', 'solves', 'skips', 'average_duration')
+
+    puzzles = list(puzzles)
+    percentiles = get_solve_duration_percentiles(
+        hunt, {puzzle['id']: puzzle['solves'] for puzzle in puzzles})
+
+    analytics = []
+    for puzzle in puzzles:
+        views, solves, skips = puzzle['views'], puzzle['solves'], puzzle['skips']
+        average = puzzle['average_duration']
+        analytics.append({
+            "puzzle_id": puzzle['id'],
+            "puzzle_name": puzzle['name'],
+            "points": puzzle['points'],
+            "views": views,
+            "solves": solves,
+            "skips": skips,
+            "skip_rate": skips / views if views else None,
+            "solve_rate": solves / views if views else None,
+            "average_solve_seconds": average.total_seconds() if average is not None else None,
+            "median_solve_seconds": None,
+            "p90_solve_seconds": None,
+            **percentiles.get(puzzle['id'], {}),
+        })
+    return analytics
+
+
+@api_view(['GET'])
+@permission_classes([IsHuntOrganizer])
+def get_puzzle_analytics(request, hunt_slug):
+    hunt = request.hunt
+    key = puzzle_analytics_cache_key(hunt.id)
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = compute_puzzle_analytics(hunt)
+        cache.set(key, analytics, PUZZLE_ANALYTICS_CACHE_SECONDS)
+    return Response(analytics)
+
+
+# bounds for the what-if parameters of rescore_teams
+MAX_GRACE_MINUTES = 60 * 24 * 30
+MAX_DEDUCTION_RATE = 100
+MAX_PUZZLE_POINTS = 1000000
+
+
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def rescore_teams(request, hunt_slug):
+    # recompute every team's points after puzzle points or hunt dates were
+    # corrected. with "dry_run": true nothing is written, and the curve
+    # (grace_minutes, deduction_rate, min_points_fraction) and puzzle values
+    # ("puzzle_points": {id: points}) can be changed to preview the result.
+    hunt = request.hunt
+    dry_run = request.data.get('dry_run') in (True, 'true')
+    try:
+        grace_minutes = float(request.data.get(
+            'grace_minutes', GRACE_PERIOD / timedelta(minutes=1)))
+        deduction_rate = float(request.data.get('deduction_rate', DEDUCTION_RATE))
+        min_points_fraction = float(request.data.get(
+            'min_points_fraction', MIN_POINTS_FRACTION))
+        puzzle_points = {int(puzzle_id): int(points) for puzzle_id, points in (
+            request.data.get('puzzle_points') or {}).items()}
+    except (TypeError, ValueError, AttributeError, OverflowError):
+        return Response(
+            {"error": "Invalid scoring parameters."},
+            status=status.HTTP_400_BAD_REQUEST,)
+    # isfinite before the comparisons, nan compares false to everything
+    if not (all(math.isfinite(value) for value in (grace_minutes, deduction_rate, min_points_fraction))
+            and 0 <= grace_minutes <= MAX_GRACE_MINUTES
+            and 0 <= deduction_rate <= MAX_DEDUCTION_RATE
+            and 0 <= min_points_fraction <= 1
+            and all(0 <= points <= MAX_PUZZLE_POINTS for points in puzzle_points.values())):
+        return Response(
+            {"error": "Scoring parameters are out of range."},
+            status=status.HTTP_400_BAD_REQUEST,)
+    curve = {
+        'grace_period': timedelta(minutes=grace_minutes),
+        'deduction_rate': deduction_rate,
+        'min_points_fraction': min_points_fraction,
+    }
+
+    what_if = puzzle_points or curve != {
+        'grace_period': GRACE_PERIOD,
+        'deduction_rate': DEDUCTION_RATE,
+        'min_points_fraction': MIN_POINTS_FRACTION,
+    }
+    if what_if and not dry_run:
+        return Response(
+            {"error": "A changed scoring curve can only be previewed with dry_run."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    with transaction.atomic():
+        teams = hunt.teams.only('id', 'name', 'points').order_by('id')
+        if not dry_run:
+            # locked before the solves are read, a solve committing meanwhile
+            # waits and adds its points on top of the new total
+            teams = teams.select_for_update()
+        teams = list(teams)
+        totals = rescore_hunt(hunt, puzzle_points, **curve)
+        changes = [{
+            "team_id": team.id,
+            "team_name": team.name,
+            "old_points": team.points,
+            "new_points": totals[team.id],
+        } for team in teams]
+
+        if not dry_run:
+            changed = [team for team in teams if team.points != totals[team.id]]
+            entries = list(LeaderboardEntry.objects.filter(
+                team__in=changed).only('id', 'team_id', 'points'))
+            for team in changed:
+                team.points = totals[team.id]
+            for entry in entries:
+                entry.points = totals[entry.team_id]
+            Team.objects.bulk_update(changed, ['points'], batch_size=500)
+            LeaderboardEntry.objects.bulk_update(entries, ['points'], batch_size=500)
+            if changed:
+                publish_event(hunt_channel(hunt.id), "leaderboard", {"rescored": True})
+                bump_leaderboard_version(hunt.slug)
+    if not dry_run:
+        clear_puzzle_analytics_cache(hunt.id)
+
+    return Response({
+        "dry_run": dry_run,
+        "changed": sum(change["old_points"] != change["new_points"] for change in changes),
+        "teams": changes,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsHuntOrganizer])
+def get_team_progress_log(request, hunt_slug, team_id):
+    hunt = request.hunt
+    try:
+        team = hunt.teams.get(id=team_id)
+    except Team.DoesNotExist:
+        return Response(
+            {"error": "Invalid team id."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    flush_wrong_answers()
+    events = TeamEvent.objects.filter(hunt=hunt, team=team).order_by(
+        'created_at', 'id').values('kind', 'puzzle_id', 'points', 'detail', 'created_at')
+    kinds = dict(TeamEvent.KIND_CHOICES)
+    return Response({
+        "state": replay_team_progress(team),
+        "events": [{**event, "kind": kinds[event["kind"]]} for event in events],
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def import_puzzle_bundle(request, hunt_slug):
+    # multipart upload, "bundle" is a puzzles.json or a zip, see puzzle_import
+    hunt = request.hunt
+    bundle = request.FILES.get('bundle')
+    if bundle is None:
+        return Response(
+            {"error": "Please upload a bundle."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    try:
+        puzzles, images = import_puzzles(hunt, bundle)
+    except BundleError as e:
+        return Response(
+            {"error": e.message, "errors": e.errors},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    return Response({
+        "success": f"{len(puzzles)} puzzles imported successfully.",
+        "puzzle_ids": [puzzle.id for puzzle in puzzles],
+        "images": len(images),
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def register_teams_from_csv(request, hunt_slug):
+    # multipart upload, "csv" holds one row per user, see bulk_registration
+    hunt = request.hunt
+    csv_file = request.FILES.get('csv')
+    if csv_file is None:
+        return Response(
+            {"error": "Please upload a csv file."},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    try:
+        teams = register_teams(hunt, csv_file)
+    except RegistrationError as e:
+        return Response(
+            {"error": e.message, "errors": e.errors},
+            status=status.HTTP_400_BAD_REQUEST,)
+
+    return Response({
+        "success": f"{len(teams)} teams registered successfully.",
+        "teams": teams,
+    }, status=status.HTTP_201_CREATED)
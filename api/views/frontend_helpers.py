@@ -6,6 +6,7 @@ from ..models import Hunt
 from django.utils import timezone
 from rest_framework.response import Response
 from ..serializers import HuntSerializer
+from .helpers import get_request_hunt, is_hunt_organizer
 
 @api_view(['GET'])
 def hunt_exists(request, hunt_slug):
@@ -18,10 +19,8 @@ def hunt_exists(request, hunt_slug):
 
 @api_view(['GET'])
 def is_user_an_organizer(request, hunt_slug):
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    organizers = hunt.organizers.all()
-    user = request.user
-    if user in organizers:
+    hunt = get_request_hunt(request, hunt_slug)
+    if is_hunt_organizer(request.user, hunt):
         return JsonResponse({"is_organizer": True})
     else:
         return JsonResponse({"is_organizer": False})
@@ -32,8 +31,7 @@ def get_users_hunts(request):
     # returns a list of the hunts(most possibly one) that the user is registered to and that is yet to start
     if not request.user.is_authenticated:
         return Response({"hunts": []})
-    user = request.user
-    hunts = user.participating_hunts.all()
+    hunts = Hunt.objects.filter(participants=request.user.id)
     hunts_list = []
     for hunt in hunts:
         serializer = HuntSerializer(hunt)
@@ -47,8 +45,7 @@ def get_users_organizing_hunts(request):
     # returns a list of hunts that the user is organizing and that is yet to start.
     if not request.user.is_authenticated:
         return Response({"hunts": []})
-    user = request.user
-    hunts = user.organizing_hunts.all()
+    hunts = Hunt.objects.filter(organizers=request.user.id)
     hunts_list = []
     for hunt in hunts:
         serializer = HuntSerializer(hunt)
@@ -1,8 +1,17 @@
 from django.utils import timezone
 import random
-from ..models import Team, Hunt
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F
+from ..models import Team, Hunt, LeaderboardEntry, TeamMembership, PuzzleTimeMaintenance
 from django.utils.timezone import timedelta
 
+try:
+    import numpy as np
+except ImportError:
+    # optional, count_points_batch falls back to plain python
+    np = None
+
 
 def is_hunt_active(hunt):
     return hunt.start_date <= timezone.now() <= hunt.end_date
@@ -16,65 +25,317 @@ def is_after_hunt_end(hunt):
     return timezone.now() > hunt.end_date
 
 
+# organizers rarely change, so a short lived per hunt id set is plenty
+ORGANIZER_CACHE_SECONDS = 60
+
+
+def get_request_hunt(request, hunt_slug):
+    # resolve the hunt once per request, permissions and the view share it
+    hunt = getattr(request, 'hunt', None)
+    if hunt is None or hunt.slug != hunt_slug:
+        hunt = Hunt.objects.get(slug=hunt_slug)
+        request.hunt = hunt
+    return hunt
+
+
+def organizer_cache_key(hunt):
+    return f"hunt:{hunt.id}:organizer_ids"
+
+
+def get_organizer_ids(hunt):
+    key = organizer_cache_key(hunt)
+    organizer_ids = cache.get(key)
+    if organizer_ids is None:
+        organizer_ids = frozenset(
+            hunt.organizers.values_list('id', flat=True))
+        cache.set(key, organizer_ids, ORGANIZER_CACHE_SECONDS)
+    return organizer_ids
+
+
+def is_hunt_organizer(user, hunt):
+    if not user.is_authenticated:
+        return False
+    return user.id in get_organizer_ids(hunt)
+
+
+def clear_organizer_cache(hunt):
+    cache.delete(organizer_cache_key(hunt))
+
+
+def puzzle_analytics_cache_key(hunt_id):
+    return f"hunt:{hunt_id}:puzzle_analytics"
+
+
+def clear_puzzle_analytics_cache(hunt_id):
+    cache.delete(puzzle_analytics_cache_key(hunt_id))
+
+
 def is_team_leader(user, team):
-    if team.leader == user:
+    if team.leader_id == user.id:
         return True
 
     return False
 
 
-def count_points(puzzle, puzzle_maintenance):
+# scoring curve, see count_points
+GRACE_PERIOD = timedelta(minutes=30)
+DEDUCTION_RATE = 6.9
+MIN_POINTS_FRACTION = 0.25
+
+
+def count_points(puzzle, puzzle_maintenance, hunt=None, grace_period=GRACE_PERIOD,
+                 deduction_rate=DEDUCTION_RATE, min_points_fraction=MIN_POINTS_FRACTION):
     start_time = puzzle_maintenance.puzzle_start_time
     end_time = puzzle_maintenance.puzzle_end_time
 
     max_points = puzzle.points
     time_taken = end_time - start_time
 
-    hunt = puzzle.hunt
+    if hunt is None:
+        hunt = puzzle.hunt
     # one problem may take the time of the entire hunt.
     max_allowed_time = hunt.end_date - hunt.start_date
 
     points = None
     # no points deduction in the first 30 mins
-    if time_taken < timedelta(minutes=30):
+    if time_taken < grace_period:
         points = max_points
     else:
-        extra_time = time_taken - timedelta(minutes=30)
-        deduction_factor = (extra_time / max_allowed_time) * 6.9
-        lower_bound = 0.25 * max_points
+        extra_time = time_taken - grace_period
+        deduction_factor = (extra_time / max_allowed_time) * deduction_rate
+        lower_bound = min_points_fraction * max_points
         points = max(max_points * (1 - deduction_factor), lower_bound)
         points = round(points)
     return points
 
 
+def count_points_batch(max_points, time_taken, max_allowed_time, grace_period=GRACE_PERIOD,
+                       deduction_rate=DEDUCTION_RATE, min_points_fraction=MIN_POINTS_FRACTION):
+    # count_points over whole arrays. max_points and time_taken are equal
+    # length sequences, times are in microseconds so the division matches
+    # timedelta / timedelta exactly. gives the same numbers as count_points.
+    allowed = max_allowed_time // timedelta(microseconds=1)
+    grace = grace_period // timedelta(microseconds=1)
+
+    if np is None:
+        points = []
+        for max_point, taken in zip(max_points, time_taken):
+            if taken < grace:
+                points.append(max_point)
+                continue
+            deduction_factor = ((taken - grace) / allowed) * deduction_rate
+            lower_bound = min_points_fraction * max_point
+            points.append(
+                round(max(max_point * (1 - deduction_factor), lower_bound)))
+        return points
+
+    max_points = np.asarray(max_points, dtype=np.float64)
+    taken = np.asarray(time_taken, dtype=np.int64)
+    deduction_factor = ((taken - grace) / allowed) * deduction_rate
+    decayed = np.maximum(max_points * (1 - deduction_factor),
+                         min_points_fraction * max_points)
+    points = np.where(taken < grace, max_points, np.round(decayed))
+    return points.astype(np.int64).tolist()
+
+
+def rescore_hunt(hunt, puzzle_points=None, **curve):
+    # recomputes every team's total from its solves. puzzle_points can
+    # override puzzle values ({puzzle_id: points}) for what-if previews.
+    # returns {team_id: points}, teams without solves get 0.
+    solves = list(PuzzleTimeMaintenance.objects.filter(
+        team__hunt=hunt, puzzle_start_time__isnull=False,
+        puzzle_end_time__isnull=False).annotate(
+        time_taken=ExpressionWrapper(
+            F('puzzle_end_time') - F('puzzle_start_time'), output_field=DurationField())
+    ).values_list('team_id', 'puzzle_id', 'puzzle__points', 'time_taken'))
+
+    puzzle_points = puzzle_points or {}
+    team_ids = [solve[0] for solve in solves]
+    max_points = [puzzle_points.get(solve[1], solve[2]) for solve in solves]
+    time_taken = [solve[3] // timedelta(microseconds=1) for solve in solves]
+    points = count_points_batch(
+        max_points, time_taken, hunt.end_date - hunt.start_date, **curve)
+
+    totals = dict.fromkeys(hunt.teams.values_list('id', flat=True), 0)
+    for team_id, point in zip(team_ids, points):
+        totals[team_id] += point
+    return totals
+
+
+def build_puzzle_deck(hunt, team):
+    puzzle_ids = list(hunt.puzzles.exclude(
+        id__in=team.viewed_puzzles.all()).values_list('id', flat=True))
+    random.shuffle(puzzle_ids)
+    return puzzle_ids
+
+
+def add_puzzle_to_decks(hunt, puzzle):
+    add_puzzles_to_decks(hunt, [puzzle])
+
+
+def add_puzzles_to_decks(hunt, puzzles):
+    # puzzles created after decks were dealt, slip each one somewhere into
+    # the unplayed part of every deck.
+    # the decks are read under the row locks, a deck dealt or played in the
+    # meantime can't be written back over
+    with transaction.atomic():
+        teams = []
+        for team in hunt.teams.select_for_update().only(
+                'id', 'puzzle_deck', 'current_puzzle_index'):
+            if not team.puzzle_deck:
+                continue
+            start = min(team.current_puzzle_index or 0, len(team.puzzle_deck))
+            for puzzle in puzzles:
+                team.puzzle_deck.insert(
+                    random.randint(start, len(team.puzzle_deck)), puzzle.id)
+            teams.append(team)
+        Team.objects.bulk_update(teams, ['puzzle_deck'])
+
+
+def get_invalid_puzzle_ids(hunt, puzzle_ids):
+    # one id__in query for the whole list instead of a get() per id
+    wanted = set()
+    invalid = []
+    for puzzle_id in puzzle_ids:
+        try:
+            wanted.add(int(puzzle_id))
+        except (TypeError, ValueError):
+            invalid.append(puzzle_id)
+    found = set(hunt.puzzles.filter(
+        id__in=wanted).values_list('id', flat=True))
+    return invalid + sorted(wanted - found)
+
+
+def generate_puzzle_orders(puzzle_ids, count, mode='latin'):
+    # 'rotated': team i starts at puzzle i and wraps around.
+    # 'latin': balanced latin square (williams design), every puzzle comes
+    # right after every other puzzle equally often, so teams don't crowd the
+    # same locations in the same sequence.
+    n = len(puzzle_ids)
+    if n == 0:
+        return [[] for _ in range(count)]
+
+    if mode == 'rotated':
+        return [[puzzle_ids[(i + j) % n] for j in range(n)]
+                for i in range(count)]
+
+    first_row = [0]
+    low, high = 1, n - 1
+    while len(first_row) < n:
+        first_row.append(low)
+        low += 1
+        if len(first_row) < n:
+            first_row.append(high)
+            high -= 1
+    rows = [[(k + r) % n for k in first_row] for r in range(n)]
+    if n % 2:
+        # odd sizes need the mirrored rows as well to be balanced
+        rows += [row[::-1] for row in rows]
+    return [[puzzle_ids[k] for k in rows[i % len(rows)]] for i in range(count)]
+
+
 def get_a_puzzle(hunt, team):
-    # get puzzle according to the puzzle order list
+    # organizer defined order if there is one, the team's shuffled deck
+    # otherwise. both are walked with current_puzzle_index.
     if team.puzzle_order_list:
-        list = team.puzzle_order_list
-        current_puzzle_index = team.current_puzzle_index
-        if current_puzzle_index >= len(list):
-            return None
-        assigning_puzzle = hunt.puzzles.get(id=list[current_puzzle_index])
-        team.current_puzzle_index += 1
-        team.save()
-        return assigning_puzzle
+        order = team.puzzle_order_list
     else:
-        # get random puzzle
-        viewed_puzzles = team.viewed_puzzles.all()
-        solved_puzzles = team.solved_puzzles.all()
-        available_puzzles = hunt.puzzles.exclude(
-            id__in=viewed_puzzles).exclude(id__in=solved_puzzles)
+        if not team.puzzle_deck:
+            deal_puzzle_deck(hunt, team)
+        order = team.puzzle_deck
 
-        if not available_puzzles.exists():
-            return None
+    current_puzzle_index = team.current_puzzle_index or 0
+    # puzzles deleted after the order or deck was made are skipped over
+    puzzles = hunt.puzzles.in_bulk(order[current_puzzle_index:])
+    # organizer lists may hold the ids as strings
+    while (current_puzzle_index < len(order)
+           and int(order[current_puzzle_index]) not in puzzles):
+        current_puzzle_index += 1
+    if current_puzzle_index >= len(order):
+        return None
+    assigning_puzzle = puzzles[int(order[current_puzzle_index])]
+    team.current_puzzle_index = current_puzzle_index + 1
+    # only the index, the deck belongs to add_puzzles_to_decks from here on
+    team.save(update_fields=['current_puzzle_index'])
+    return assigning_puzzle
 
-        random_puzzle = random.choice(available_puzzles)
-        return random_puzzle
+
+def deal_puzzle_deck(hunt, team):
+    # locked like add_puzzles_to_decks, so a puzzle created meanwhile either
+    # is in the new deck or gets inserted into it
+    with transaction.atomic():
+        locked = Team.objects.select_for_update().only(
+            'puzzle_deck', 'current_puzzle_index').get(id=team.id)
+        if locked.puzzle_deck:
+            # dealt by a concurrent request already
+            team.puzzle_deck = locked.puzzle_deck
+            team.current_puzzle_index = locked.current_puzzle_index
+            return
+        team.puzzle_deck = build_puzzle_deck(hunt, team)
+        team.current_puzzle_index = 0
+        team.save(update_fields=['puzzle_deck', 'current_puzzle_index'])
 
 
 def user_already_in_a_team(user, hunt):
-    teams = Team.objects.filter(hunt=hunt)
-    for team in teams:
-        if user in team.members.all():
-            return True
-    return False
+    return TeamMembership.objects.filter(hunt=hunt, user_id=user.id).exists()
+
+
+def get_users_team(user, hunt):
+    membership = TeamMembership.objects.select_related('team').filter(
+        hunt=hunt, user_id=user.id).first()
+    if membership is None:
+        return None
+    return membership.team
+
+
+def add_team_member(team, user):
+    # raises IntegrityError when the user already has a team in this hunt
+    with transaction.atomic():
+        TeamMembership.objects.create(
+            hunt_id=team.hunt_id, team=team, user_id=user.id)
+        team.members.add(user.id)
+
+
+# leaderboard
+
+def get_full_name(user):
+    return f"{user.first_name or ''} {user.last_name or ''}".strip()
+
+
+def create_leaderboard_entry(team, leader=None):
+    # leader can be request.user to save loading team.leader
+    return LeaderboardEntry.objects.create(
+        hunt_id=team.hunt_id, team=team, team_name=team.name,
+        leader_name=get_full_name(leader or team.leader), points=team.points)
+
+
+def add_points_to_leaderboard(team, points, solved_at):
+    updated = LeaderboardEntry.objects.filter(team=team).update(
+        points=F('points') + points, last_solve_at=solved_at)
+    if not updated:
+        # team predates the leaderboard table, build its row from scratch
+        team.refresh_from_db(fields=['points'])
+        entry = create_leaderboard_entry(team)
+        entry.last_solve_at = solved_at
+        entry.save(update_fields=['last_solve_at'])
+
+
+def get_leaderboard_page(hunt, offset=0, limit=None):
+    entries = LeaderboardEntry.objects.filter(hunt=hunt).order_by(
+        '-points', F('last_solve_at').asc(nulls_last=True), 'id').values(
+        'team_name', 'leader_name', 'points', 'last_solve_at')
+    if limit is not None:
+        entries = entries[offset:offset + limit]
+    elif offset:
+        entries = entries[offset:]
+
+    leaderboard = []
+    for rank, entry in enumerate(entries, start=offset + 1):
+        leaderboard.append({
+            "rank": rank,
+            "team_name": entry['team_name'],
+            "team_leader": entry['leader_name'],
+            "points": entry['points'],
+            "last_solve_at": entry['last_solve_at'],
+        })
+    return leaderboard
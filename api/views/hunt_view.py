@@ -1,16 +1,24 @@
 from django.utils.text import slugify
-from django.http import JsonResponse
-from ..models import Hunt, User, Puzzle, PuzzleImage, Team, PuzzleTimeMaintenance, Announcement, Hint, HuntImage, Rule
-from ..serializers import HuntSerializer, UserDataSerializer, PuzzleSerializer, PuzzleImageSerializer, HuntImageSerializer, RuleSerializer, AnnouncementSerializer
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from ..models import Hunt, User, Puzzle, PuzzleImage, Team, PuzzleTimeMaintenance, Announcement, Hint, HuntImage, Rule, TeamEvent
+from ..serializers import HuntSerializer, PuzzleSerializer, PuzzleImageSerializer, HuntImageSerializer, RuleSerializer, AnnouncementSerializer, AnnouncementFeedSerializer
 import random
 import string
 from django.utils import timezone
-from rest_framework import status, generics, permissions
+from django.utils.dateparse import parse_datetime
+from rest_framework import status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAdminUser
 
-from .helpers import is_hunt_active, is_before_hunt_start, is_after_hunt_end, is_team_leader, get_a_puzzle, count_points, user_already_in_a_team
+from ..broker import publish_event, hunt_channel, team_channel
+from ..progress import log_team_event, log_wrong_answer
+from ..response_cache import cache_hunt_response, clear_hunt_responses, get_cached_response, get_response_cache_stats, etag_response, leaderboard_etag, announcements_etag, current_puzzle_etag, get_conditional_response, bump_leaderboard_version, bump_team_progress_version
+from .helpers import is_hunt_active, is_after_hunt_end, get_a_puzzle, count_points, user_already_in_a_team, create_leaderboard_entry, add_points_to_leaderboard, get_leaderboard_page, get_users_team, add_team_member, clear_organizer_cache, add_puzzle_to_decks, get_invalid_puzzle_ids, get_full_name, clear_puzzle_analytics_cache
+from ..permissions import IsHuntOrganizer, IsHuntOrganizerOrReadOnly
 
 # Let's have the implementation in this order - Before Hunt, During Hunt, After Hunt
 
@@ -18,9 +26,8 @@ from .helpers import is_hunt_active, is_before_hunt_start, is_after_hunt_end, is
 
 import uuid
 
-from rest_framework import serializers
-
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch
 
 # class HuntListCreateView(generics.ListCreateAPIView):
 #     queryset = Hunt.objects.all()
@@ -48,7 +55,6 @@ def create_hunt(request):
             {"error": "Please login to create a hunt"},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    user = User.objects.get(id=request.user.id)
     name = request.data.get('name')
     description = request.data.get('description')
     start_date = request.data.get('start_date')
@@ -79,7 +85,7 @@ def create_hunt(request):
         poster_img=poster_img,
         payment_uuid=uuid.uuid4()
     )
-    hunt.organizers.add(user)
+    hunt.organizers.add(request.user.id)
     hunt.save()
 
     return Response({
@@ -90,9 +96,32 @@ def create_hunt(request):
 class HuntDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Hunt.objects.all()
     serializer_class = HuntSerializer
-    permission_classes = [AllowAny]
+    permission_classes = [IsHuntOrganizerOrReadOnly]
     lookup_field = 'slug'
 
+    def get_object(self):
+        # writes already looked it up in the permission check
+        hunt = getattr(self.request, 'hunt', None)
+        if hunt is not None:
+            return hunt
+        return super().get_object()
+
+    def retrieve(self, request, *args, **kwargs):
+        return get_cached_response(
+            request, kwargs['slug'], 'detail',
+            lambda: super(HuntDetailView, self).retrieve(request, *args, **kwargs))
+
+    def perform_update(self, serializer):
+        old_slug = serializer.instance.slug
+        hunt = serializer.save()
+        clear_hunt_responses(old_slug)
+        clear_hunt_responses(hunt.slug)
+
+    def perform_destroy(self, instance):
+        slug = instance.slug
+        instance.delete()
+        clear_hunt_responses(slug)
+
 # manual payment logic
 
 
@@ -111,8 +140,9 @@ def is_hunt_paid_for(request, hunt_slug):
 
 
 @api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
 def create_puzzle(request, hunt_slug):
-    hunt = Hunt.objects.get(slug=hunt_slug)
+    hunt = request.hunt
     name = request.data.get('name')
     description = request.data.get('description')
     type = request.data.get('type')
@@ -127,18 +157,13 @@ def create_puzzle(request, hunt_slug):
             {"error": "Please provide all fields"},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    user = User.objects.get(id=request.user.id)
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
-
     # save images
     images = request.FILES.getlist('images')
     puzzle = Puzzle.objects.create(
         hunt=hunt, name=name, description=description, type=type, answer=answer, points=points)
     for image in images:
         PuzzleImage.objects.create(puzzle=puzzle, image=image)
+    add_puzzle_to_decks(hunt, puzzle)
 
     return Response({
         "success": "Puzzle created successfully",
@@ -151,15 +176,15 @@ def create_team(request, hunt_slug):
         return Response(
             {"error": "Please login to create a team"},
             status=status.HTTP_400_BAD_REQUEST,)
-    user = User.objects.get(id=request.user.id)
-    if user_already_in_a_team(user, Hunt.objects.get(slug=hunt_slug)):
+    user = request.user
+    hunt = Hunt.objects.get(slug=hunt_slug)
+    if user_already_in_a_team(user, hunt):
         return Response(
             {"error": "You are already in a team for this hunt."},
             status=status.HTTP_400_BAD_REQUEST,)
 
     # TODO: make sure its before hunt stage
 
-    hunt = Hunt.objects.get(slug=hunt_slug)
     name = request.data.get('name')
     leader = user
     remaining_skips = hunt.number_of_skips_for_each_team
@@ -172,11 +197,21 @@ def create_team(request, hunt_slug):
             {"error": "Please provide all fields"},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    team = Team.objects.create(hunt=hunt, name=name, leader=leader,
-                               remaining_skips=remaining_skips, joining_password=joining_password)
-    team.members.add(leader)
-    team.save()
-    hunt.participants.add(user)
+    try:
+        with transaction.atomic():
+            team = Team.objects.create(hunt=hunt, name=name, leader_id=leader.id,
+                                       remaining_skips=remaining_skips, joining_password=joining_password)
+            add_team_member(team, leader)
+            create_leaderboard_entry(team, leader)
+            bump_leaderboard_version(hunt.slug)
+    except IntegrityError:
+        # lost a race against another create/join for the same user
+        return Response(
+            {"error": "You are already in a team for this hunt."},
+            status=status.HTTP_400_BAD_REQUEST,)
+    hunt.participants.add(user.id)
+    # participants are part of the serialized hunt
+    clear_hunt_responses(hunt.slug)
 
     return Response({
         "success": "Team created successfully. Here is your joining password: " + joining_password + ". Please share this password with your team members.",
@@ -194,8 +229,8 @@ def join_team(request, hunt_slug):
         return Response(
             {"error": "You cannot join a team now."},
             status=status.HTTP_400_BAD_REQUEST,)
-    user = User.objects.get(id=request.user.id)
-    if user_already_in_a_team(user, Hunt.objects.get(slug=hunt_slug)):
+    user = request.user
+    if user_already_in_a_team(user, hunt):
         return Response(
             {"error": "You are already in a team for this hunt."},
             status=status.HTTP_400_BAD_REQUEST,)
@@ -210,84 +245,94 @@ def join_team(request, hunt_slug):
             {"error": "Invalid team password. Please try again."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    team.members.add(user)
-    team.save()
-    hunt.participants.add(user)
-    hunt.save()
+    try:
+        add_team_member(team, user)
+    except IntegrityError:
+        return Response(
+            {"error": "You are already in a team for this hunt."},
+            status=status.HTTP_400_BAD_REQUEST,)
+    hunt.participants.add(user.id)
+    # participants are part of the serialized hunt
+    clear_hunt_responses(hunt.slug)
 
     return Response({
         "success": "You have joined the team successfully.",
     }, status=status.HTTP_201_CREATED)
 
 
+class TeamsDataPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def get_team_data(team):
+    # expects leader selected and members prefetched
+    return {
+        "team_id": team.id,
+        "team_name": team.name,
+        "team_leader": get_full_name(team.leader),
+        "team_members": [{
+            "name": get_full_name(member),
+            "email": member.email,
+        } for member in team.members.all()],
+        "team_points": team.points,
+        "team_puzzle_order": team.puzzle_order_list,
+        "team_password": team.joining_password,
+    }
+
+
+def stream_teams_data(teams):
+    # yields one team at a time so memory stays flat on big hunts
+    yield "["
+    for i, team in enumerate(teams.iterator(chunk_size=200)):
+        yield ("," if i else "") + json.dumps(get_team_data(team), cls=DjangoJSONEncoder)
+    yield "]"
+
+
 @api_view(['GET'])
+@permission_classes([IsHuntOrganizer])
 def get_all_teams_data(request, hunt_slug):
-    # all data, and their puzzle order
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not hunt:
-        return Response(
-            {"error": "Invalid hunt slug."},
-            status=status.HTTP_400_BAD_REQUEST,)
-    teams = Team.objects.filter(hunt=hunt)
-    data = []
-    for team in teams:
-        team_members = []
-        for member in team.members.all():
-            team_members.append({
-                "name": member.first_name + " " + member.last_name,
-                "email": member.email,
-            })
-        data.append({
-            "team_id": team.id,
-            "team_name": team.name,
-            "team_leader": team.leader.first_name + " " + team.leader.last_name,
-            "team_members": team_members,
-            "team_points": team.points,
-            "team_puzzle_order": team.puzzle_order_list,
-            "team_password": team.joining_password,
-        })
-
-    return Response(data)
+    # all data, and their puzzle order. ?page=N paginates, ?stream=true
+    # streams the full list instead of building it in memory.
+    hunt = request.hunt
+    teams = hunt.teams.select_related('leader').prefetch_related(
+        Prefetch('members', queryset=User.objects.only(
+            'first_name', 'last_name', 'email'))).order_by('id')
 
+    if request.query_params.get('stream') == 'true':
+        return StreamingHttpResponse(
+            stream_teams_data(teams), content_type='application/json')
 
-@api_view(['POST'])
-def create_puzzle_order_for_a_team(request, hunt_slug, team_id):
-    if not request.user.is_authenticated:
-        return Response(
-            {"error": "Please login to create a puzzle order"},
-            status=status.HTTP_400_BAD_REQUEST,)
+    if 'page' in request.query_params:
+        paginator = TeamsDataPagination()
+        page = paginator.paginate_queryset(teams, request)
+        return paginator.get_paginated_response(
+            [get_team_data(team) for team in page])
 
-    user = User.objects.get(id=request.user.id)
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    team = Team.objects.get(id=team_id)
+    return Response([get_team_data(team) for team in teams])
 
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
 
-    if not team:
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def create_puzzle_order_for_a_team(request, hunt_slug, team_id):
+    hunt = request.hunt
+    # only teams of the hunt the caller organizes
+    try:
+        team = hunt.teams.get(id=team_id)
+    except Team.DoesNotExist:
         return Response(
             {"error": "Invalid team id."},
-            status=status.HTTP_400_BAD_REQUEST,)
+            status=status.HTTP_404_NOT_FOUND,)
     list = request.data.get('list')
     if not list:
         return Response(
             {"error": "Please provide the list."},
             status=status.HTTP_400_BAD_REQUEST,)
-    for puzzle_id in list:
-        try:
-            puzzle = Puzzle.objects.get(id=puzzle_id)
-        except Puzzle.DoesNotExist:
-            return Response(
-                {"error": "Invalid puzzle id."},
-                status=status.HTTP_400_BAD_REQUEST,)
-        if puzzle.hunt != hunt:
-            return Response(
-                {"error": "Invalid puzzle id."},
-                status=status.HTTP_400_BAD_REQUEST,)
+    if get_invalid_puzzle_ids(hunt, list):
+        return Response(
+            {"error": "Invalid puzzle id."},
+            status=status.HTTP_400_BAD_REQUEST,)
     team.set_puzzle_order_list(list)
-    team.save()
 
     return Response(
         {"success": "Puzzle order created successfully."}, status=status.HTTP_201_CREATED)
@@ -311,14 +356,19 @@ def get_current_puzzle_view(request, hunt_slug):
             {"error": "Hunt is not active now."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if not user_already_in_a_team(request.user, hunt):
+    team = get_users_team(request.user, hunt)
+    if team is None:
         return Response(
             {"error": "You are not in a team for this hunt."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    user = User.objects.get(id=request.user.id)
-    team = Team.objects.get(hunt=hunt, members=user)
+    # steady state polling ends here with a 304, before any puzzle work
+    return get_conditional_response(
+        request, lambda: current_puzzle_etag(team),
+        lambda: get_current_puzzle_response(hunt, team))
 
+
+def get_current_puzzle_response(hunt, team):
     # no puzzle has been assigned to this team yet(probably their first visit)
     if not team.current_puzzle:
         puzzle = get_a_puzzle(hunt, team)
@@ -328,11 +378,17 @@ def get_current_puzzle_view(request, hunt_slug):
                 status=status.HTTP_400_BAD_REQUEST,)
         team.current_puzzle = puzzle
         team.viewed_puzzles.add(puzzle)
-        team.save()
+        # only the assignment, points are updated with F() on solve and this
+        # team may have been loaded before that
+        team.save(update_fields=['current_puzzle'])
         puzzle_mainenance = PuzzleTimeMaintenance.objects.create(
             puzzle=puzzle, team=team)
         puzzle_mainenance.puzzle_start_time = timezone.now()
         puzzle_mainenance.save()
+        log_team_event(team, TeamEvent.ASSIGNED, puzzle)
+        bump_team_progress_version(team.id)
+        publish_event(team_channel(team.id), "puzzle",
+                      {"puzzle_id": puzzle.id})
 
     puzzle = team.current_puzzle
     if puzzle in team.solved_puzzles.all():
@@ -346,11 +402,17 @@ def get_current_puzzle_view(request, hunt_slug):
                 status=status.HTTP_400_BAD_REQUEST,)
         team.current_puzzle = puzzle
         team.viewed_puzzles.add(puzzle)
-        team.save()
+        # only the assignment, points are updated with F() on solve and this
+        # team may have been loaded before that
+        team.save(update_fields=['current_puzzle'])
         puzzle_mainenance = PuzzleTimeMaintenance.objects.create(
             puzzle=puzzle, team=team)
         puzzle_mainenance.puzzle_start_time = timezone.now()
         puzzle_mainenance.save()
+        log_team_event(team, TeamEvent.ASSIGNED, puzzle)
+        bump_team_progress_version(team.id)
+        publish_event(team_channel(team.id), "puzzle",
+                      {"puzzle_id": puzzle.id})
 
     puzzle_serializer = PuzzleSerializer(puzzle)
     return Response(puzzle_serializer.data)
@@ -372,15 +434,13 @@ def get_next_or_skip_puzzle(request, hunt_slug, type_param):
             {"error": "Hunt is not active now."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if not user_already_in_a_team(request.user, hunt):
+    team = get_users_team(request.user, hunt)
+    if team is None:
         return Response(
             {"error": "You are not in a team for this hunt."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    user = User.objects.get(id=request.user.id)
-    try:
-        team = Team.objects.get(hunt=hunt, leader=user)
-    except Team.DoesNotExist:
+    if team.leader_id != request.user.id:
         return Response(
             {"error": "You need to be the leader of your team to get the next puzzle."},
             status=status.HTTP_400_BAD_REQUEST,)
@@ -396,25 +456,42 @@ def get_next_or_skip_puzzle(request, hunt_slug, type_param):
                 status=status.HTTP_400_BAD_REQUEST,)
     # handle skip
     if type_param == 'skip':
-        if team.remaining_skips <= 0:
+        # guarded decrement, two quick skips can't both spend the last one
+        skipped = Team.objects.filter(
+            id=team.id, remaining_skips__gt=0).update(
+            remaining_skips=F('remaining_skips') - 1)
+        if not skipped:
             return Response(
                 {"error": "You don't have any skips left."},
                 status=status.HTTP_400_BAD_REQUEST,)
 
         team.remaining_skips -= 1
+    previous_puzzle = team.current_puzzle
     puzzle = get_a_puzzle(hunt, team)
     if puzzle is None:
+        if type_param == 'skip':
+            # nothing to skip to, give the skip back
+            Team.objects.filter(id=team.id).update(
+                remaining_skips=F('remaining_skips') + 1)
         return Response(
             {"error": "No more puzzles left to skip."},
             status=status.HTTP_400_BAD_REQUEST,)
     team.current_puzzle = puzzle
     team.viewed_puzzles.add(puzzle)
-    team.save()
+    team.save(update_fields=['current_puzzle'])
 
     puzzle_mainenance = PuzzleTimeMaintenance.objects.create(
         puzzle=puzzle, team=team)
     puzzle_mainenance.puzzle_start_time = timezone.now()
     puzzle_mainenance.save()
+    if type_param == 'skip' and previous_puzzle is not None:
+        log_team_event(team, TeamEvent.SKIPPED, previous_puzzle)
+    log_team_event(team, TeamEvent.ASSIGNED, puzzle)
+    bump_team_progress_version(team.id)
+    publish_event(team_channel(team.id), "puzzle", {
+        "puzzle_id": puzzle.id,
+        "remaining_skips": team.remaining_skips,
+    })
 
     # return the new puzzle
     puzzle_serializer = PuzzleSerializer(puzzle)
@@ -428,22 +505,22 @@ def submit_answer(request, puzzle_id):
             {"error": "Please login to check the answer"},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    puzzle = Puzzle.objects.get(id=puzzle_id)
+    try:
+        puzzle = Puzzle.objects.select_related('hunt').get(id=puzzle_id)
+    except Puzzle.DoesNotExist:
+        return Response(
+            {"error": "Invalid puzzle id."},
+            status=status.HTTP_400_BAD_REQUEST,)
     hunt = puzzle.hunt
 
     try:
-        team = Team.objects.get(leader=request.user, hunt=hunt)
+        team = Team.objects.get(leader_id=request.user.id, hunt=hunt)
     except Team.DoesNotExist:
         return Response(
             {"error": "Only the leader of the team can submit the answer."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if not puzzle:
-        return Response(
-            {"error": "Invalid puzzle id."},
-            status=status.HTTP_400_BAD_REQUEST,)
-
-    answer = request.data.get('answer')
+    answer = request.data.get('answer') or ''
     # get rid of front and trailing spaces
     answer = answer.strip()
     if not answer:
@@ -451,34 +528,66 @@ def submit_answer(request, puzzle_id):
             {"error": "Please provide the answer."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if puzzle not in team.viewed_puzzles.all():
+    # the time maintenance row is created when the puzzle is handed to the
+    # team, so it doubles as the "viewed" check.
+    puzzle_maintenance = PuzzleTimeMaintenance.objects.filter(
+        puzzle=puzzle, team=team).first()
+    if puzzle_maintenance is None:
         return Response(
             {"error": "This puzzle is not available for your team... yet."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if answer.lower() == puzzle.answer.lower():
-        # handle correct answers and points.
-        team.solved_puzzles.add(puzzle)
-        puzzle_maintenance = PuzzleTimeMaintenance.objects.get(
-            puzzle=puzzle, team=team)
-        puzzle_maintenance.puzzle_end_time = timezone.now()
-        puzzle_maintenance.save()
-
-        points = count_points(puzzle, puzzle_maintenance)
-        team.points += points
-        team.save()
-
-        return Response({
-            "success": "Correct answer. You have earned " + str(points) + " points.",
-        }, status=status.HTTP_200_OK)
+    if puzzle_maintenance.puzzle_end_time is not None:
+        return Response(
+            {"error": "You have already solved this puzzle."},
+            status=status.HTTP_400_BAD_REQUEST,)
 
-    else:
+    if answer.lower() != puzzle.answer.lower():
+        log_wrong_answer(team, puzzle, answer)
         return Response({
             "error": "Wrong answer. Please try again.",
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    # handle correct answers and points. the conditional update on the end
+    # time is the guard: of two concurrent correct submissions only one
+    # matches a row, so the points are counted exactly once.
+    end_time = timezone.now()
+    with transaction.atomic():
+        solved = PuzzleTimeMaintenance.objects.filter(
+            id=puzzle_maintenance.id, puzzle_end_time__isnull=True).update(
+            puzzle_end_time=end_time)
+        if not solved:
+            return Response(
+                {"error": "You have already solved this puzzle."},
+                status=status.HTTP_400_BAD_REQUEST,)
+
+        puzzle_maintenance.puzzle_end_time = end_time
+        points = count_points(puzzle, puzzle_maintenance)
+        Team.objects.filter(id=team.id).update(points=F('points') + points)
+        Team.solved_puzzles.through.objects.create(
+            team_id=team.id, puzzle_id=puzzle.id)
+        add_points_to_leaderboard(team, points, end_time)
+        log_team_event(team, TeamEvent.SOLVED, puzzle, points=points)
+        bump_team_progress_version(team.id)
+        bump_leaderboard_version(hunt.slug)
+        transaction.on_commit(lambda: clear_puzzle_analytics_cache(hunt.id))
+
+        publish_event(team_channel(team.id), "solved", {
+            "puzzle_id": puzzle.id,
+            "points": points,
+        })
+        publish_event(hunt_channel(hunt.id), "leaderboard", {
+            "team_name": team.name,
+            "points": team.points + points,
+        })
+
+    return Response({
+        "success": "Correct answer. You have earned " + str(points) + " points.",
+    }, status=status.HTTP_200_OK)
+
 
 @api_view(['GET'])
+@etag_response(leaderboard_etag)
 def get_leaderboard(request, hunt_slug):
     # TODO: after first production - let orgs choose whether they want the leaderboard to show at a particular time.
     hunt = Hunt.objects.get(slug=hunt_slug)
@@ -487,50 +596,97 @@ def get_leaderboard(request, hunt_slug):
             {"error": "Invalid hunt slug."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    teams = Team.objects.filter(hunt=hunt)
-    leaderboard = []
-    for team in teams:
-        leaderboard.append({
-            "team_name": team.name,
-            "team_leader": team.leader.first_name + " " + team.leader.last_name,
-            "points": team.points,
-        })
+    # optional paging: ?offset=20&limit=20, whole board otherwise
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        limit = request.query_params.get('limit')
+        limit = max(int(limit), 0) if limit is not None else None
+    except ValueError:
+        return Response(
+            {"error": "offset and limit must be integers."},
+            status=status.HTTP_400_BAD_REQUEST,)
 
-    leaderboard = sorted(leaderboard, key=lambda k: k['points'], reverse=True)
+    leaderboard = get_leaderboard_page(hunt, offset, limit)
     return Response(leaderboard)
 
 
+# incremental feed, ?since=<announcement id or iso timestamp> returns only
+# newer announcements, oldest first. add ?wait=<seconds> to long-poll until
+# something new shows up, see stream_view.announcements.
+ANNOUNCEMENT_FEED_SIZE = 100
+
+
+def get_new_announcements(hunt, since):
+    announcements = hunt.announcements.select_related('creator')
+    if since.isdigit():
+        announcements = announcements.filter(
+            id__gt=int(since)).order_by('id')
+    else:
+        announcements = announcements.filter(
+            created_at__gt=parse_feed_timestamp(since)).order_by('created_at', 'id')
+    return list(announcements[:ANNOUNCEMENT_FEED_SIZE])
+
+
+def get_announcement_feed_data(announcements, since):
+    if since.isdigit():
+        since = int(since)
+    return {
+        "announcements": AnnouncementFeedSerializer(announcements, many=True).data,
+        "cursor": announcements[-1].id if announcements else since,
+    }
+
+
+def parse_feed_timestamp(since):
+    # a timestamp without an offset is taken in the site's time zone
+    value = parse_datetime(since)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def is_valid_feed_cursor(since):
+    if since.isdigit():
+        return True
+    try:
+        return parse_feed_timestamp(since) is not None
+    except ValueError:
+        return False
+
+
 @api_view(['GET'])
 def get_announcements(request, hunt_slug):
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not hunt:
+    since = request.GET.get('since')
+    if since is not None and not is_valid_feed_cursor(since):
         return Response(
-            {"error": "Invalid hunt slug."},
+            {"error": "since must be an announcement id or an ISO timestamp."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    announcements = hunt.announcements.all().order_by('-created_at')
-    serializer = AnnouncementSerializer(announcements, many=True)
-    return Response(serializer.data)
+    return get_announcements_response(request, hunt_slug)
 
 
-@api_view(['POST'])
-def add_announcements(request, hunt_slug):
+@etag_response(announcements_etag)
+@cache_hunt_response('announcements')
+def get_announcements_response(request, hunt_slug):
     hunt = Hunt.objects.get(slug=hunt_slug)
     if not hunt:
         return Response(
             {"error": "Invalid hunt slug."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    if not request.user.is_authenticated:
-        return Response(
-            {"error": "Please login to add an announcement"},
-            status=status.HTTP_400_BAD_REQUEST,)
+    since = request.GET.get('since')
+    if since is not None:
+        announcements = get_new_announcements(hunt, since)
+        return Response(get_announcement_feed_data(announcements, since))
+
+    announcements = hunt.announcements.all().order_by('-created_at')
+    serializer = AnnouncementSerializer.for_request(request, announcements)
+    return Response(serializer.data)
 
-    user = User.objects.get(id=request.user.id)
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
+
+@api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
+def add_announcements(request, hunt_slug):
+    hunt = request.hunt
 
     text = request.data.get('text')
     if not text:
@@ -538,7 +694,14 @@ def add_announcements(request, hunt_slug):
             {"error": "Please provide the text."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    Announcement.objects.create(hunt=hunt, text=text, creator=user)
+    announcement = Announcement.objects.create(
+        hunt=hunt, text=text, creator_id=request.user.id)
+    clear_hunt_responses(hunt.slug, 'announcements')
+    publish_event(hunt_channel(hunt.id), "announcement", {
+        "id": announcement.id,
+        "text": announcement.text,
+        "created_at": announcement.created_at,
+    })
     return Response({
         "success": "Announcement added successfully.",
     }, status=status.HTTP_201_CREATED)
@@ -551,16 +714,16 @@ def add_announcements(request, hunt_slug):
 
 
 @api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
 def add_hint(request, hunt_slug, team_id, puzzle_id):
-    user = User.objects.get(id=request.user.id)
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not user in hunt.organizers.all():
+    # only teams and puzzles of the hunt the caller organizes
+    try:
+        team = request.hunt.teams.get(id=team_id)
+        puzzle = request.hunt.puzzles.get(id=puzzle_id)
+    except (Team.DoesNotExist, Puzzle.DoesNotExist):
         return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
-
-    team = Team.objects.get(id=team_id)
-    puzzle = Puzzle.objects.get(id=puzzle_id)
+            {"error": "Invalid team or puzzle id."},
+            status=status.HTTP_404_NOT_FOUND,)
 
     text = request.data.get('text')
 
@@ -569,7 +732,13 @@ def add_hint(request, hunt_slug, team_id, puzzle_id):
             {"error": "Please provide the text."},
             status=status.HTTP_400_BAD_REQUEST,)
 
-    Hint.objects.create(team=team, puzzle=puzzle, text=text)
+    hint = Hint.objects.create(team=team, puzzle=puzzle, text=text)
+    log_team_event(team, TeamEvent.HINT_RECEIVED, puzzle)
+    publish_event(team_channel(team.id), "hint", {
+        "puzzle_id": puzzle.id,
+        "text": hint.text,
+        "created_at": hint.created_at,
+    })
     return Response({
         "success": "Hint added successfully.",
     }, status=status.HTTP_200_OK)
@@ -593,13 +762,14 @@ def get_puzzle_images(request, puzzle_id):
             {"error": "Invalid puzzle id."},
             status=status.HTTP_400_BAD_REQUEST,)
     images = puzzle.images.all()
-    serializer = PuzzleImageSerializer(images, many=True)
+    serializer = PuzzleImageSerializer.for_request(request, images)
     return Response(serializer.data)
 
 # After Hunt
 
 
 @api_view(['GET'])
+@cache_hunt_response('images')
 def get_hunt_images(request, hunt_slug):
     hunt = Hunt.objects.get(slug=hunt_slug)
     if not hunt:
@@ -607,22 +777,14 @@ def get_hunt_images(request, hunt_slug):
             {"error": "Invalid hunt slug."},
             status=status.HTTP_400_BAD_REQUEST,)
     images = hunt.images.all()
-    serializer = HuntImageSerializer(images, many=True)
+    serializer = HuntImageSerializer.for_request(request, images)
     return Response(serializer.data)
 
 
 @api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
 def post_hunt_images(request, hunt_slug):
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not hunt:
-        return Response(
-            {"error": "Invalid hunt slug."},
-            status=status.HTTP_400_BAD_REQUEST,)
-    user = User.objects.get(id=request.user.id)
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
+    hunt = request.hunt
 
     images = request.FILES.getlist('images')
 
@@ -634,12 +796,14 @@ def post_hunt_images(request, hunt_slug):
             status=status.HTTP_400_BAD_REQUEST,)
     for image in images:
         HuntImage.objects.create(hunt=hunt, image=image)
+    clear_hunt_responses(hunt.slug, 'images')
     return Response({
         "success": "Images added successfully.",
     }, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
+@cache_hunt_response('rules')
 def get_rules(request, hunt_slug):
     hunt = Hunt.objects.get(slug=hunt_slug)
     if not hunt:
@@ -647,90 +811,60 @@ def get_rules(request, hunt_slug):
             {"error": "Invalid hunt slug."},
             status=status.HTTP_400_BAD_REQUEST,)
     rules = Rule.objects.filter(hunt=hunt)
-    serializer = RuleSerializer(rules, many=True)
+    serializer = RuleSerializer.for_request(request, rules)
     return Response(serializer.data)
 
 
 @api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
 def add_rule(request, hunt_slug):
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not hunt:
-        return Response(
-            {"error": "Invalid hunt slug."},
-            status=status.HTTP_400_BAD_REQUEST,)
-
-    if not request.user.is_authenticated:
-        return Response(
-            {"error": "Please login to add a rule"},
-            status=status.HTTP_400_BAD_REQUEST,)
-    user = User.objects.get(id=request.user.id)
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
+    hunt = request.hunt
     rule = request.data.get('rule')
     Rule.objects.create(hunt=hunt, rule=rule)
+    clear_hunt_responses(hunt.slug, 'rules')
     return Response({
         "success": "Rule added successfully.",
     }, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
+@permission_classes([IsHuntOrganizer])
 def add_organizer_to_hunt(request, hunt_slug):
     # we get a list of emails from frontend and set them as organizers
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    user = request.user
-    organizers = hunt.organizers.all()
-    if user not in organizers:
-        return JsonResponse({"error": "You are not an organizer of this hunt"})
-    else:
-        emails_found = 0
-        emails_not_found = 0
-        emails = request.data.get('emails')
-        print(emails)
-        for email in emails:
-            try:
-                user = User.objects.get(email=email)
-                hunt.organizers.add(user)
-                emails_found += 1
-            except:
-                emails_not_found += 1
-        hunt.save()
-
-        if (emails_not_found == 0):
-            return Response({
-                "success": str(emails_found) + " organizers added successfully.",
-            }, status=status.HTTP_201_CREATED)
-
-        if (emails_found == 0):
-            return Response({
-                "error": "No organizers were added." + str(emails_not_found) + " emails were not found.",
-            }, status=status.HTTP_400_BAD_REQUEST)
-
+    hunt = request.hunt
+    emails_found = 0
+    emails_not_found = 0
+    emails = request.data.get('emails')
+    for email in emails:
+        try:
+            user = User.objects.get(email=email)
+            hunt.organizers.add(user)
+            emails_found += 1
+        except User.DoesNotExist:
+            emails_not_found += 1
+    clear_organizer_cache(hunt)
+    # organizers are part of the serialized hunt
+    clear_hunt_responses(hunt.slug)
+
+    if (emails_not_found == 0):
         return Response({
-            "success": str(emails_found) + " organizers added successfully. " + str(emails_not_found) + " emails were not found.",
+            "success": str(emails_found) + " organizers added successfully.",
         }, status=status.HTTP_201_CREATED)
 
+    if (emails_found == 0):
+        return Response({
+            "error": "No organizers were added." + str(emails_not_found) + " emails were not found.",
+        }, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
-def get_all_puzzles_of_a_hunt(request, hunt_slug):
-    if not request.user.is_authenticated:
-        return Response(
-            {"error": "Please login to get all puzzles"},
-            status=status.HTTP_400_BAD_REQUEST,)
-
-    hunt = Hunt.objects.get(slug=hunt_slug)
-    if not hunt:
-        return Response(
-            {"error": "Invalid hunt slug."},
-            status=status.HTTP_400_BAD_REQUEST,)
+    return Response({
+        "success": str(emails_found) + " organizers added successfully. " + str(emails_not_found) + " emails were not found.",
+    }, status=status.HTTP_201_CREATED)
 
-    user = User.objects.get(id=request.user.id)
-    if not user in hunt.organizers.all():
-        return Response(
-            {"error": "You are not an organizer of this hunt."},
-            status=status.HTTP_400_BAD_REQUEST,)
 
+@api_view(['GET'])
+@permission_classes([IsHuntOrganizer])
+def get_all_puzzles_of_a_hunt(request, hunt_slug):
+    hunt = request.hunt
     puzzles = hunt.puzzles.all()
     serializer = PuzzleSerializer(puzzles, many=True)
     return Response(serializer.data)
@@ -743,3 +877,9 @@ def get_recent_hunts(request):
     hunts = [hunt for hunt in hunts if hunt.payment_completed == True]
     serializer = HuntSerializer(hunts, many=True)
     return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    return Response(get_response_cache_stats())
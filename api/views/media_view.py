@@ -0,0 +1,167 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from ..image_variants import InvalidVariant, get_variant
+from ..storage import get_content_hash
+
+# the bytes behind a content addressed name never change
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# older uploads and their variants are keyed by name only, keep the browser
+# cache short enough for a replaced upload to show up
+VARIANT_MAX_AGE = 60 * 60 * 24
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def set_media_cache_headers(response, name):
+    if get_content_hash(name) is not None:
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=VARIANT_MAX_AGE)
+
+
+def get_media_etag(name, stat):
+    content_hash = get_content_hash(name)
+    if content_hash is not None:
+        return f'"{content_hash}"'
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(request, size, etag, mtime):
+    # (start, end) for a single satisfiable byte range, None to send the whole
+    # file, 'unsatisfiable' for a 416. multiple ranges get the whole file.
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+
+    # If-Range: only honour the range while the client's copy is current
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        since = parse_http_date_safe(if_range)
+        if since is None or int(mtime) > since:
+            return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # invalid, not unsatisfiable (rfc 9110 14.1.1), ignore it
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # suffix range, the last n bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return 'unsatisfiable'
+    return start, end
+
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, name, cache_name=None):
+    # serves a file from MEDIA_ROOT with validators, byte ranges, caching
+    # headers and optional web server offload. cache_name picks the caching
+    # policy when it differs from the served file (image variants).
+    # dotfiles are ours (the storage lock file), not uploads
+    if any(part.startswith('.') for part in name.split('/')):
+        raise Http404()
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404()
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404()
+    if not os.path.isfile(path):
+        raise Http404()
+
+    etag = get_media_etag(name, stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = build_file_response(request, name, path, stat, etag)
+
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(stat.st_mtime))
+    set_media_cache_headers(response, cache_name or name)
+    return response
+
+
+def build_file_response(request, name, path, stat, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_SENDFILE:
+        # the web server handles ranges and the body itself
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+            # a uri, spaces, % and non ascii names have to be escaped
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        else:
+            response['X-Sendfile'] = path
+        return response
+
+    size = stat.st_size
+    byte_range = parse_range(request, size, etag, stat.st_mtime)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        iter_file_range(path, start, length), status=status,
+        content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, path)
+
+
+@require_safe
+def get_image_variant(request, size, name):
+    try:
+        variant = get_variant(name, size)
+    except InvalidVariant:
+        raise Http404("No such image variant.")
+    return serve_file(request, variant, cache_name=name)
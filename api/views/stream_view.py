@@ -0,0 +1,132 @@
+# server-sent events, replaces polling the leaderboard, announcements and
+# current puzzle. needs the app to run under ASGI (core.asgi:application).
+
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..broker import get_broker, hunt_channel, team_channel
+from ..models import Hunt, TeamMembership
+from ..response_cache import get_section_version
+from .hunt_view import get_announcements, get_new_announcements, get_announcement_feed_data, is_valid_feed_cursor
+
+HEARTBEAT_SECONDS = 15
+# EventSource reconnects on its own, so keep connections bounded.
+MAX_STREAM_SECONDS = 300
+
+ANNOUNCEMENT_MAX_WAIT = 25
+# the broker only wakes waiters in this process. announcements posted through
+# another one move the version stamp, which is read at most this often per
+# hunt and process, however many clients wait.
+ANNOUNCEMENT_POLL_INTERVAL = 1
+
+# {hunt slug: (version, monotonic time read)}
+_announcement_versions = {}
+
+
+async def get_announcement_version(hunt_slug):
+    version, read_at = _announcement_versions.get(hunt_slug, (None, 0))
+    if time.monotonic() - read_at >= ANNOUNCEMENT_POLL_INTERVAL:
+        version = await sync_to_async(get_section_version)(hunt_slug, 'announcements')
+        _announcement_versions[hunt_slug] = (version, time.monotonic())
+    return version
+
+
+def get_user_id_from_token(raw_token):
+    # EventSource can't send headers, so the access token comes as ?token=
+    if not raw_token:
+        return None
+    try:
+        token = AccessToken(raw_token)
+    except TokenError:
+        return None
+    return token.get(api_settings.USER_ID_CLAIM)
+
+
+def format_event(message):
+    data = json.dumps(message["data"], cls=DjangoJSONEncoder)
+    return f"event: {message['event']}\ndata: {data}\n\n"
+
+
+async def event_stream(channels):
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield "retry: 3000\n\n"
+        waited = 0
+        while waited < MAX_STREAM_SECONDS:
+            message = await subscription.get(HEARTBEAT_SECONDS)
+            if message is None:
+                waited += HEARTBEAT_SECONDS
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(message)
+    finally:
+        subscription.close()
+
+
+async def hunt_events(request, hunt_slug):
+    hunt_id = await Hunt.objects.filter(slug=hunt_slug).values_list(
+        'id', flat=True).afirst()
+    if hunt_id is None:
+        return JsonResponse({"error": "Invalid hunt slug."}, status=400)
+
+    channels = [hunt_channel(hunt_id)]
+    user_id = get_user_id_from_token(request.GET.get('token'))
+    if user_id is not None:
+        team_id = await TeamMembership.objects.filter(
+            hunt_id=hunt_id, user_id=user_id).values_list('team_id', flat=True).afirst()
+        if team_id is not None:
+            channels.append(team_channel(team_id))
+
+    response = StreamingHttpResponse(
+        event_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def announcements(request, hunt_slug):
+    # the feed itself is the sync drf view, only ?since=..&wait=.. long-polls
+    # here so a waiting client holds no worker thread
+    since = request.GET.get('since')
+    if since is None or not request.GET.get('wait') or not is_valid_feed_cursor(since):
+        return await sync_to_async(get_announcements)(request, hunt_slug)
+
+    try:
+        wait = min(float(request.GET.get('wait')), ANNOUNCEMENT_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({"error": "wait must be a number of seconds."}, status=400)
+
+    hunt = await Hunt.objects.filter(slug=hunt_slug).afirst()
+    if hunt is None:
+        return JsonResponse({"error": "Invalid hunt slug."}, status=400)
+
+    # subscribe before the first query, or an announcement in between is missed
+    subscription = get_broker().subscribe([hunt_channel(hunt.id)])
+    try:
+        deadline = time.monotonic() + wait
+        version = await get_announcement_version(hunt_slug)
+        new_announcements = await sync_to_async(get_new_announcements)(hunt, since)
+        while not new_announcements and time.monotonic() < deadline:
+            message = await subscription.get(
+                min(ANNOUNCEMENT_POLL_INTERVAL, deadline - time.monotonic()))
+            if message is not None and message["event"] != "announcement":
+                continue
+            latest_version = await get_announcement_version(hunt_slug)
+            if message is None and latest_version == version:
+                continue
+            version = latest_version
+            # not cached, an empty answer must not short circuit the next poll
+            new_announcements = await sync_to_async(get_new_announcements)(hunt, since)
+    finally:
+        subscription.close()
+
+    data = await sync_to_async(get_announcement_feed_data)(new_announcements, since)
+    return JsonResponse(data, encoder=DjangoJSONEncoder)
@@ -37,6 +37,15 @@ AUTH_USER_MODEL = "api.User"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# let the web server send media files instead of a python worker.
+# None, "x-sendfile" (apache mod_xsendfile, lighttpd) or "x-accel-redirect"
+# (nginx, MEDIA_ACCEL_REDIRECT_PREFIX must be an internal location aliased
+# to MEDIA_ROOT).
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+# an image file reused by an upload this recently isn't deleted yet, the
+# upload's row may not be committed (see api/storage.py)
+IMAGE_RELEASE_GRACE_SECONDS = 60
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 # Application definition
@@ -85,6 +94,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# request.user comes from the token claims, only whether the account is still
+# active is looked up, and cached this long
+AUTH_USER_STATE_CACHE_SECONDS = 60
+
+# pub/sub used by the /events/ stream, LocalBroker only works on a single process
+EVENT_BROKER = "api.broker.LocalBroker"
 
 # Configure DRF settings
 REST_FRAMEWORK = {
@@ -92,7 +109,7 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.AllowAny",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_RENDERER_CLASSES": [
         "rest_framework.renderers.JSONRenderer",
@@ -125,13 +142,13 @@ SIMPLE_JWT = {
     "USER_AUTHENTICATION_RULE": "rest_framework_simplejwt.authentication.default_user_authentication_rule",
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
-    "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    "TOKEN_USER_CLASS": "api.authentication.ClaimsUser",
     "JTI_CLAIM": "jti",
     "SLIDING_TOKEN_REFRESH_EXP_CLAIM": "refresh_exp",
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.tokens.BloomTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -139,6 +156,14 @@ SIMPLE_JWT = {
 }
 
 
+# bloom filter in front of the refresh token blacklist, see api/tokens.py
+TOKEN_BLACKLIST_BLOOM_CAPACITY = 100000
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = 0.001
+TOKEN_BLACKLIST_BLOOM_REBUILD_SECONDS = 60 * 60
+# how often other processes' blacklist rows are pulled into the filter
+TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS = 5
+
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -146,10 +171,54 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a file rather than :memory: so threaded tests get real connections
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# locmem by default, CACHE_BACKEND=file keeps it on disk and shares it between
+# processes on the same machine.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION',
+            os.path.join(BASE_DIR, 'cache') if CACHE_BACKEND == 'file' else 'treasurekoii'),
+    }
+}
+
+# how long public hunt responses (rules, announcements...) stay cached,
+# writes invalidate them right away anyway
+RESPONSE_CACHE_SECONDS = 300
+
+
+# Password hashing
+# pbkdf2_sha256 run on a bounded pool, see api/hashers.py. the pooled hasher
+# takes over pbkdf2_sha256 so django's own pbkdf2 hasher is left out.
+
+PASSWORD_HASHERS = [
+    'api.hashers.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# hashes running at once, None for one per cpu
+PASSWORD_HASHING_WORKERS = None
+# hashes allowed to wait for a worker before logins get a 503
+PASSWORD_HASHING_QUEUE = 32
+PASSWORD_HASHING_RETRY_AFTER = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 